@@ -1,4 +1,23 @@
 # aws_utils/__init__.py
-from .aws_utils import create_session, get_all_account_ids_by_sso
+from .aws_utils import create_session, get_all_account_ids_by_sso, get_all_accounts_by_sso
+from .account_directory import AccountDirectory, parse_account_selectors, selector_key, needs_enrichment, select_accounts, default_account_directory_expiry
+from .policy_store import PolicyStore, policy_digest, iter_policy_documents
+from .policy_index import PolicyIndex, decode_policy_document, iter_policy_statements, managed_policy_statements
+from .circuit_breaker import CircuitBreaker, default_breaker_threshold, default_breaker_backoff, default_breaker_max_backoff
+from .cache_utils import CacheStore, cached_response, cached_list_response, estimate_size, COMPRESSION_CHOICES, EVICTION_CHOICES, default_hot_entries, default_cache_max_bytes
+from .shared_cache import SharedCache, DirectoryBackend, RedisBackend, create_shared_cache, default_shared_cache_lease, default_shared_cache_wait
+from .usage_history import UsageHistoryStore, default_history_retention_days, default_history_raw_days
+from .change_log import ChangeLog, default_change_log_versions
 
-__all__ = ['create_session', 'get_all_account_ids_by_sso']
+__all__ = [
+    'create_session', 'get_all_account_ids_by_sso', 'get_all_accounts_by_sso',
+    'AccountDirectory', 'parse_account_selectors', 'selector_key', 'needs_enrichment', 'select_accounts', 'default_account_directory_expiry',
+    'PolicyStore', 'policy_digest', 'iter_policy_documents',
+    'PolicyIndex', 'decode_policy_document', 'iter_policy_statements', 'managed_policy_statements',
+    'CircuitBreaker', 'default_breaker_threshold', 'default_breaker_backoff', 'default_breaker_max_backoff',
+    'CacheStore', 'cached_response', 'cached_list_response', 'estimate_size',
+    'COMPRESSION_CHOICES', 'EVICTION_CHOICES', 'default_hot_entries', 'default_cache_max_bytes',
+    'SharedCache', 'DirectoryBackend', 'RedisBackend', 'create_shared_cache', 'default_shared_cache_lease', 'default_shared_cache_wait',
+    'UsageHistoryStore', 'default_history_retention_days', 'default_history_raw_days',
+    'ChangeLog', 'default_change_log_versions',
+]
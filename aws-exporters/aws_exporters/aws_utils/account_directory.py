@@ -0,0 +1,215 @@
+"""
+account_directory.py
+
+Metadata:
+
+- Author: Hideki.M (Y29udGFjdC1tZUBhd3M0Lm1lLnVrCg==)
+- Version: 1.0.0+ts1.coldasyou
+- Last Updated: 2026-10-19
+- License: MIT
+
+Account directory for multi-account crawls.
+
+The account list is fully paginated from AWS Identity Center, cached with its own TTL
+and optionally enriched with the OU path and tags of each account from AWS Organizations.
+Include/exclude selectors (OU, tag, account ID list) limit a crawl to the accounts a
+dashboard actually needs.
+
+Functions/Classes included:
+- AccountDirectory: Cached (and optionally enriched) account list.
+- parse_account_selectors: Parses and validates selector query parameters.
+- selector_key: Canonical string for a set of selectors (usable in cache keys).
+- needs_enrichment: Whether the selectors need OU paths or tags.
+- select_accounts: Applies selectors to the account list.
+"""
+
+import logging
+import re
+import threading
+import time
+from botocore.exceptions import ClientError
+from .aws_utils import get_all_accounts_by_sso
+
+### INIT CONFIGURATIONS ----------------------------------------
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+### GLOBAL VARIABLES -------------------------------------------
+default_account_directory_expiry = 3600  # 60 minutes
+
+# Selector query parameters (comma-separated values) and the pattern each value must match
+ACCOUNT_SELECTORS = {
+    'account_ids': re.compile(r'^\d{12}$'),
+    'exclude_account_ids': re.compile(r'^\d{12}$'),
+    # OU/Root ID (e.g. ou-ab12-cd34ef56) or OU path from the root (e.g. Root/Workloads/Prod)
+    'include_ou': re.compile(r'^(ou-[0-9a-z]{4,32}-[0-9a-z]{8,32}|r-[0-9a-z]{4,32}|[\w+=.@ /-]{1,512})$'),
+    'exclude_ou': re.compile(r'^(ou-[0-9a-z]{4,32}-[0-9a-z]{8,32}|r-[0-9a-z]{4,32}|[\w+=.@ /-]{1,512})$'),
+    # Tag key (present) or key=value
+    'include_tag': re.compile(r'^[\w .:/+\-@]{1,128}(=[\w .:/=+\-@]{0,256})?$'),
+    'exclude_tag': re.compile(r'^[\w .:/+\-@]{1,128}(=[\w .:/=+\-@]{0,256})?$'),
+}
+
+###-------------------------------------------------------------
+
+class AccountDirectory:
+    """
+    Account list from 🔴AWS Identity Center, cached with its own TTL.
+
+    Parameters:
+    - sso_region (str): AWS SSO region.
+    - expiry (int): Cache expiry time of the account list in seconds.
+    - sso_access_token (str, optional): Pre-existing SSO access token, if available.
+    - org_client_factory (callable, optional): Returns an Organizations client, used to add
+      the OU path and tags of each account. Without it, OU and tag selectors are unavailable.
+    """
+
+    def __init__(self, sso_region, expiry=default_account_directory_expiry, sso_access_token=None, org_client_factory=None):
+        self.sso_region = sso_region
+        self.expiry = expiry
+        self.sso_access_token = sso_access_token
+        self.org_client_factory = org_client_factory
+        self.accounts = None
+        self.enriched = False
+        self.fetched_at = 0
+        self.lock = threading.Lock()
+
+    @property
+    def can_enrich(self):
+        return self.org_client_factory is not None
+
+    def get_accounts(self, enrich=False):
+        """
+        Returns the account list as [{'AccountID', 'AccountName', 'EmailAddress'[, 'OUIds', 'OUPath', 'Tags']}].
+        """
+        with self.lock:
+            current_time = time.time()
+            if self.accounts is not None and (current_time - self.fetched_at) < self.expiry and (self.enriched or not enrich):
+                return self.accounts
+
+            logger.info("🔍 Retrieving account list from AWS Identity Center...")
+            accounts = [
+                {
+                    'AccountID': account['accountId'],
+                    'AccountName': account.get('accountName'),
+                    'EmailAddress': account.get('emailAddress'),
+                }
+                for account in get_all_accounts_by_sso(self.sso_region, self.sso_access_token)
+            ]
+            enriched = False
+            if accounts and (enrich or (self.enriched and self.can_enrich)):
+                enriched = self._enrich(accounts)
+
+            # An empty list means the listing failed, keep serving the previous one
+            if accounts:
+                self.accounts = accounts
+                self.enriched = enriched
+                self.fetched_at = current_time
+                logger.info(f"✅ Retrieved {len(accounts)} accounts.")
+            return self.accounts or []
+
+    def _enrich(self, accounts):
+        org_client = self.org_client_factory() if self.can_enrich else None
+        if not org_client:
+            logger.error("❌ Failed to create an Organizations client, OU paths and tags are unavailable.")
+            return False
+
+        parents = {}
+        ou_names = {}
+        try:
+            for account in accounts:
+                ou_ids, ou_path = self._get_ou_path(org_client, account['AccountID'], parents, ou_names)
+                account['OUIds'] = ou_ids
+                account['OUPath'] = '/'.join(ou_path)
+                account['Tags'] = self._get_tags(org_client, account['AccountID'])
+            return True
+        except ClientError as e:
+            logger.error(f"❌ Failed to retrieve OU paths and tags: {e}")
+            for account in accounts:
+                for key in ['OUIds', 'OUPath', 'Tags']:
+                    account.pop(key, None)
+            return False
+
+    def _get_ou_path(self, org_client, child_id, parents, ou_names):
+        # Walk up to the root, memoizing parents so sibling accounts share the lookups
+        ou_ids = []
+        node_id = child_id
+        while True:
+            if node_id not in parents:
+                parent = org_client.list_parents(ChildId=node_id)['Parents'][0]
+                parents[node_id] = (parent['Id'], parent['Type'])
+            parent_id, parent_type = parents[node_id]
+            ou_ids.insert(0, parent_id)
+            if parent_type == 'ROOT':
+                ou_names.setdefault(parent_id, 'Root')
+                break
+            if parent_id not in ou_names:
+                ou_names[parent_id] = org_client.describe_organizational_unit(OrganizationalUnitId=parent_id)['OrganizationalUnit']['Name']
+            node_id = parent_id
+        return ou_ids, [ou_names[ou_id] for ou_id in ou_ids]
+
+    def _get_tags(self, org_client, account_id):
+        paginator = org_client.get_paginator('list_tags_for_resource')
+        tags = {}
+        for response in paginator.paginate(ResourceId=account_id):
+            for tag in response['Tags']:
+                tags[tag['Key']] = tag['Value']
+        return tags
+
+# Function to parse and validate the account selectors from query parameters
+def parse_account_selectors(params):
+    selectors = {}
+    for name, pattern in ACCOUNT_SELECTORS.items():
+        raw = params.get(name)
+        if not raw:
+            continue
+        values = sorted({value.strip() for value in raw.split(',') if value.strip()})
+        for value in values:
+            if not pattern.match(value):
+                raise ValueError(f"Invalid value for {name}: {value}")
+        if values:
+            selectors[name] = values
+    return selectors
+
+# Function to get a canonical string for a set of selectors
+def selector_key(selectors):
+    return '&'.join(f"{name}={','.join(selectors[name])}" for name in sorted(selectors))
+
+# Function to check whether the selectors need OU paths or tags
+def needs_enrichment(selectors):
+    return any(name in selectors for name in ['include_ou', 'exclude_ou', 'include_tag', 'exclude_tag'])
+
+def _match_ou(account, value):
+    if value in account.get('OUIds', []):
+        return True
+    # Path selectors match the OU itself and everything below it
+    path = account.get('OUPath', '')
+    value = value.strip('/')
+    return path == value or path.startswith(value + '/')
+
+def _match_tag(account, value):
+    tags = account.get('Tags', {})
+    key, sep, tag_value = value.partition('=')
+    if not sep:
+        return key in tags
+    return tags.get(key) == tag_value
+
+# Function to apply include/exclude selectors to the account list
+def select_accounts(accounts, selectors):
+    selected = []
+    for account in accounts:
+        # Each include selector must match (any of its values), no exclude selector may match
+        if 'account_ids' in selectors and account['AccountID'] not in selectors['account_ids']:
+            continue
+        if 'exclude_account_ids' in selectors and account['AccountID'] in selectors['exclude_account_ids']:
+            continue
+        if 'include_ou' in selectors and not any(_match_ou(account, value) for value in selectors['include_ou']):
+            continue
+        if 'exclude_ou' in selectors and any(_match_ou(account, value) for value in selectors['exclude_ou']):
+            continue
+        if 'include_tag' in selectors and not any(_match_tag(account, value) for value in selectors['include_tag']):
+            continue
+        if 'exclude_tag' in selectors and any(_match_tag(account, value) for value in selectors['exclude_tag']):
+            continue
+        selected.append(account)
+    return selected
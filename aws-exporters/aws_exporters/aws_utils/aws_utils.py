@@ -16,6 +16,7 @@ from AWS Single Sign-On (SSO) and AWS Organizations services.
 Functions included:
 - get_sso_access_token: Retrieves the latest SSO access token.
 - get_temporary_credentials: Retrieves temporary credentials using AWS SSO.
+- get_all_accounts_by_sso: Retrieves all accounts (fully paginated) using AWS SSO.
 - get_all_account_ids_by_sso: Retrieves all account IDs using AWS SSO.
 - get_all_account_ids: Retrieves all account IDs using AWS Organizations.
 """
@@ -106,7 +107,8 @@ def get_temporary_credentials(account_id, permission_set_name, sso_region, sso_a
             logger.error("❌ The SSO access token is expired.")
             return None
 
-    sso_client = boto3.client('sso', region_name=sso_region)
+    # A session per call: the default session is not thread-safe and crawls call this from worker threads
+    sso_client = boto3.session.Session().client('sso', region_name=sso_region)
     try:
         response = sso_client.get_role_credentials(
             accountId=account_id,
@@ -149,7 +151,7 @@ def create_session(account_id, permission_set_name, sso_region, service_name, va
         if not valid_sso_access_token:
             sso_access_token, expires_at = get_sso_access_token()
         else:
-            sso_access_token = valid_sso_access_token
+            sso_access_token, expires_at = valid_sso_access_token, None
 
         # Check if the token is expired
         if is_token_expired(expires_at):
@@ -165,7 +167,8 @@ def create_session(account_id, permission_set_name, sso_region, service_name, va
         if not credentials:
             raise ValueError("❌ Failed to retrieve temporary credentials.")
 
-        session = boto3.Session(
+        # A new session per call, so clients can be created from worker threads
+        session = boto3.session.Session(
             aws_access_key_id=credentials['accessKeyId'],
             aws_secret_access_key=credentials['secretAccessKey'],
             aws_session_token=credentials['sessionToken']
@@ -176,26 +179,29 @@ def create_session(account_id, permission_set_name, sso_region, service_name, va
         logger.error(f"❌ Failed to create session (the 🔴SSO access token might be expired.): \n{e}")
         return None
 
-# Function to get all account IDs from 🔴AWS Identity Center
-def get_all_account_ids_by_sso(sso_region):
-    account_ids = []
-    
-    sso_access_token, expires_at = get_sso_access_token()
-    if is_token_expired(expires_at):
-        logger.error("❌ The SSO access token is expired.")
-        return account_ids
+# Function to get all accounts (fully paginated) from 🔴AWS Identity Center
+def get_all_accounts_by_sso(sso_region, sso_access_token=None):
+    accounts = []
+
+    if not sso_access_token:
+        sso_access_token, expires_at = get_sso_access_token()
+        if is_token_expired(expires_at):
+            logger.error("❌ The SSO access token is expired.")
+            return accounts
 
     try:
-        sso_client = boto3.client('sso', region_name=sso_region)
+        sso_client = boto3.session.Session().client('sso', region_name=sso_region)
         
         if not sso_client:
             logger.error(f"❌ Failed to create session (Your 🔴SSO access token might be expired.)")
         else:
-            response = sso_client.list_accounts(accessToken=sso_access_token)
-            accounts = response['accountList']
-            
-            for account in accounts:
-                account_ids.append(account['accountId'])
+            # list_accounts is paginated, a single call silently truncates large organizations
+            paginator = sso_client.get_paginator('list_accounts')
+            all_pages = []
+            for page in paginator.paginate(accessToken=sso_access_token):
+                all_pages.extend(page['accountList'])
+            # Only a complete listing is returned (a failure part-way through returns nothing)
+            accounts = all_pages
 
     except ClientError as e:
         error_code = e.response['Error']['Code']
@@ -214,7 +220,11 @@ def get_all_account_ids_by_sso(sso_region):
     finally:
         del sso_access_token
 
-    return account_ids
+    return accounts
+
+# Function to get all account IDs from 🔴AWS Identity Center
+def get_all_account_ids_by_sso(sso_region, sso_access_token=None):
+    return [account['accountId'] for account in get_all_accounts_by_sso(sso_region, sso_access_token)]
     
 # Function to get all account IDs from 🔴AWS Organizations
 def get_all_account_ids():
@@ -0,0 +1,301 @@
+"""
+cache_utils.py
+
+Metadata:
+
+- Author: Hideki.M (Y29udGFjdC1tZUBhd3M0Lm1lLnVrCg==)
+- Version: 1.0.0+ts1.coldasyou
+- Last Updated: 2026-10-19
+- License: MIT
+
+Cache helpers shared by the exporters.
+
+The exporters keep their responses in a module-level `cache`. A fully expanded boto3
+object graph uses many times more memory than its JSON encoding, and nothing used to
+bound how many entries piled up. This module provides a dict-like cache manager that
+can keep each entry as compressed JSON bytes (decoding it only when a request needs
+object-level access) and that evicts entries to stay inside a byte budget.
+
+Functions/Classes included:
+- estimate_size: Estimates the in-memory size of an object graph in bytes.
+- CacheStore: Dict-like cache with optional compression, a decoded LRU and a byte budget.
+- cached_response: Returns a Flask response for a cache entry without decoding it when possible.
+
+With a shared backend (see shared_cache.py), `CacheStore.fetch` lets replicas reuse each
+other's results instead of crawling AWS once per replica.
+"""
+
+import json
+import logging
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from flask import Response, jsonify
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+### INIT CONFIGURATIONS ----------------------------------------
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+### GLOBAL VARIABLES -------------------------------------------
+COMPRESSION_CHOICES = ['none', 'zlib', 'zstd']
+EVICTION_CHOICES = ['lru', 'cost']
+default_hot_entries = 4
+default_cache_max_bytes = 256 * 1024 * 1024  # 256 MiB (0 = unbounded)
+
+###-------------------------------------------------------------
+
+# Function to estimate the in-memory size of an object graph (shared objects are counted once)
+def estimate_size(value):
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return total
+
+class CacheStore(MutableMapping):
+    """
+    Dict-like cache manager used as the exporters' `cache`.
+
+    Parameters:
+    - compression (str): 'none', 'zlib' or 'zstd' ('zstd' needs the optional `zstandard` module; falls back to zlib).
+    - hot_entries (int): How many decoded entries to keep in the LRU for object-level access (compressed mode).
+    - dumps (callable, optional): Serializer returning a JSON string (e.g. `app.json.dumps`, so
+      cached responses are byte-for-byte what `jsonify` would return). Defaults to json.dumps.
+    - max_bytes (int): Byte budget for all entries (0 = unbounded).
+    - eviction (str): 'lru' evicts the least recently used entry, 'cost' evicts the entry that is
+      cheapest to rebuild per byte (cost = seconds it took to build, see `set`).
+    - on_evict (callable, optional): Called with the key of every entry dropped to stay inside the budget
+      (exporters drop the key's `cache_times` and derived state there).
+    - shared (SharedCache, optional): Backend shared with other replicas, used by `fetch`.
+
+    Decoded values of compressed entries are JSON round-tripped, so datetimes come back as strings.
+    """
+
+    def __init__(self, compression='none', hot_entries=default_hot_entries, dumps=None,
+                 max_bytes=default_cache_max_bytes, eviction='lru', on_evict=None, shared=None):
+        if compression == 'zstd' and zstandard is None:
+            logger.warning("⚠️  'zstandard' is not installed, falling back to zlib compression.")
+            compression = 'zlib'
+        self.compression = compression
+        self.hot_entries = hot_entries
+        self.dumps = dumps or (lambda value: json.dumps(value, default=str))
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.on_evict = on_evict
+        self.shared = shared
+        self.source_times = {}  # key -> (crawl time of the previous fetch, of the latest fetch)
+        self.entries = OrderedDict()  # key -> value (or compressed bytes), in LRU order
+        self.sizes = {}
+        self.costs = {}
+        self.hot = OrderedDict()
+        self.hot_sizes = {}
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def _compress(self, payload):
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor().compress(payload)
+        return zlib.compress(payload)
+
+    def _decompress(self, blob):
+        if self.compression == 'zstd':
+            return zstandard.ZstdDecompressor().decompress(blob)
+        return zlib.decompress(blob)
+
+    @property
+    def compressed(self):
+        return self.compression != 'none'
+
+    def set(self, key, value, cost=None):
+        """
+        Stores an entry, then evicts other entries if the byte budget is exceeded.
+
+        Parameters:
+        - key (str): Cache key.
+        - value: JSON-serializable value.
+        - cost (float, optional): Seconds it took to build the value (used by the 'cost' eviction policy).
+        """
+        if self.compressed:
+            stored = self._compress(self.dumps(value).encode('utf-8'))
+            size = len(stored)
+        else:
+            stored = value
+            size = estimate_size(value)
+
+        with self.lock:
+            self.entries[key] = stored
+            self.entries.move_to_end(key)
+            self.sizes[key] = size
+            self.costs[key] = cost if cost is not None else self.costs.get(key, 1.0)
+            self._drop_hot(key)
+            self._enforce_budget(key)
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        with self.lock:
+            stored = self.entries[key]
+            self.entries.move_to_end(key)
+            if not self.compressed:
+                return stored
+            if key in self.hot:
+                self.hot.move_to_end(key)
+                return self.hot[key]
+
+        value = json.loads(self._decompress(stored))
+        if self.hot_entries > 0:
+            size = estimate_size(value)
+            with self.lock:
+                if key in self.entries:
+                    self.hot[key] = value
+                    self.hot_sizes[key] = size
+                    while len(self.hot) > self.hot_entries:
+                        self._drop_hot(next(iter(self.hot)))
+                    self._enforce_budget(key)
+        return value
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self.entries[key]
+            self.sizes.pop(key, None)
+            self.costs.pop(key, None)
+            self.source_times.pop(key, None)
+            self._drop_hot(key)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def _drop_hot(self, key):
+        self.hot.pop(key, None)
+        self.hot_sizes.pop(key, None)
+
+    def _used_bytes(self):
+        return sum(self.sizes.values()) + sum(self.hot_sizes.values())
+
+    def _enforce_budget(self, keep_key):
+        if not self.max_bytes:
+            return
+
+        # Decoded copies are the cheapest thing to give back
+        while self.hot and self._used_bytes() > self.max_bytes:
+            self._drop_hot(next(iter(self.hot)))
+
+        # An entry that is over budget on its own is not worth evicting everything else for
+        if self.sizes.get(keep_key, 0) > self.max_bytes:
+            self._evict(keep_key)
+            return
+
+        while self._used_bytes() > self.max_bytes:
+            candidates = [key for key in self.entries if key != keep_key]
+            if not candidates:
+                break
+            if self.eviction == 'cost':
+                victim = min(candidates, key=lambda key: self.costs.get(key, 1.0) / max(self.sizes.get(key, 1), 1))
+            else:
+                victim = candidates[0]
+            self._evict(victim)
+
+    def _evict(self, key):
+        logger.info(f"♻️  Evicting cache entry '{key}' ({self.sizes.get(key, 0)} bytes) to stay within {self.max_bytes} bytes.")
+        del self[key]
+        self.evictions += 1
+        if self.on_evict:
+            self.on_evict(key)
+
+    def fetch(self, key, current_time, max_age, build, min_time=0, wait=None, publish=None):
+        """
+        Builds the value of an expired entry, or reuses the one another replica published.
+
+        Without a shared backend this simply calls `build`. The caller still stores the
+        result with `set` (and records the returned time), so derived state is rebuilt locally,
+        unless `unchanged` shows the result is the snapshot this cache already holds.
+        `wait` and `publish` are passed to SharedCache.fetch.
+
+        Returns:
+        - tuple: (value, fetched_time)
+        """
+        if self.shared is None:
+            value, fetched_time, source_time = build(), current_time, current_time
+        else:
+            value, fetched_time, source_time = self.shared.fetch(key, current_time, max_age, build, min_time, wait, publish)
+        with self.lock:
+            self.source_times[key] = (self.source_times.get(key, (None, None))[1], source_time if value else None)
+        return value, fetched_time
+
+    def unchanged(self, key):
+        """
+        Returns True when the latest `fetch` of `key` returned the same snapshot as the previous
+        one and it is still cached (e.g. a stale result served while another replica refreshes),
+        so the caller can keep the entry and everything derived from it.
+        """
+        with self.lock:
+            previous, latest = self.source_times.get(key, (None, None))
+            return latest is not None and previous == latest and key in self.entries
+
+    def get_json(self, key):
+        """
+        Returns a compressed entry as serialized JSON bytes, without building the object graph.
+        """
+        with self.lock:
+            stored = self.entries[key]
+            self.entries.move_to_end(key)
+        return self._decompress(stored)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'Compression': self.compression,
+                'Eviction': self.eviction,
+                'MaxBytes': self.max_bytes,
+                'UsedBytes': self._used_bytes(),
+                'Evictions': self.evictions,
+                'Entries': {key: {'Bytes': self.sizes[key], 'Cost': round(self.costs[key], 3)} for key in self.entries},
+                'HotEntries': list(self.hot),
+                'Shared': self.shared.stats() if self.shared else None,
+            }
+
+# Function to return a cached entry as a Flask response
+def cached_response(cache, key):
+    # Compressed entries are served as-is, only object graphs need to be serialized
+    if isinstance(cache, CacheStore) and cache.compressed:
+        return Response(cache.get_json(key), mimetype='application/json')
+    return jsonify(cache[key])
+
+# Function to serve several cache entries as one JSON list (entries evicted meanwhile are left out)
+def cached_list_response(cache, keys):
+    # Compressed entries are joined as-is, only object graphs need to be serialized
+    if isinstance(cache, CacheStore) and cache.compressed:
+        parts = []
+        for key in keys:
+            try:
+                parts.append(cache.get_json(key))
+            except KeyError:
+                continue
+        return Response(b'[' + b','.join(parts) + b']', mimetype='application/json')
+    records = (cache.get(key) for key in keys)
+    return jsonify([record for record in records if record is not None])
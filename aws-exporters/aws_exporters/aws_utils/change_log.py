@@ -0,0 +1,123 @@
+"""
+change_log.py
+
+Metadata:
+
+- Author: Hideki.M (Y29udGFjdC1tZUBhd3M0Lm1lLnVrCg==)
+- Version: 1.0.0+ts1.coldasyou
+- Last Updated: 2026-10-19
+- License: MIT
+
+Structural diffs between consecutive crawl snapshots.
+
+An exporter flattens each refreshed snapshot into {node_id: node} and records it here.
+The diff against the previous snapshot is computed once at refresh time, so consumers
+polling `changes?since=<epoch>.<version>` only receive the added, removed and modified nodes.
+
+Change logs are kept per process: with several replicas, each one numbers its own versions
+under its own epoch, so a consumer that reaches another replica is told to resync.
+
+Classes included:
+- ChangeLog: Versioned, bounded log of snapshot diffs.
+"""
+
+import secrets
+import threading
+from collections import deque
+
+### GLOBAL VARIABLES -------------------------------------------
+default_change_log_versions = 100
+
+###-------------------------------------------------------------
+
+class ChangeLog:
+    """
+    Keeps the latest flattened snapshot and the diffs of the last `max_versions` refreshes.
+
+    Versions start at 0 (no snapshot yet) and restart when the exporter restarts. Consumers
+    pass back the `Version` token (`<epoch>.<version>`) of their previous response; the epoch
+    is random per process, so a token from before a restart or from another replica resyncs.
+    """
+
+    def __init__(self, max_versions=default_change_log_versions):
+        self.max_versions = max_versions
+        self.epoch = secrets.randbits(48)
+        self.version = 0
+        self.nodes = {}
+        self.deltas = deque()
+        self.lock = threading.Lock()
+
+    def record(self, nodes):
+        """
+        Records a new snapshot ({node_id: node}) and returns its version.
+
+        A snapshot identical to the previous one does not create a new version.
+        """
+        with self.lock:
+            added = {node_id: node for node_id, node in nodes.items() if node_id not in self.nodes}
+            removed = [node_id for node_id in self.nodes if node_id not in nodes]
+            modified = {node_id: node for node_id, node in nodes.items() if node_id in self.nodes and self.nodes[node_id] != node}
+            if self.version and not (added or removed or modified):
+                return self.version
+
+            self.version += 1
+            self.nodes = nodes
+            self.deltas.append((self.version, added, removed, modified))
+            while len(self.deltas) > self.max_versions:
+                self.deltas.popleft()
+            return self.version
+
+    @staticmethod
+    def parse_token(token):
+        """
+        Returns the (epoch, version) of a `<epoch>.<version>` token ((None, None) without one).
+
+        Raises ValueError when the token is malformed, e.g. a bare version without its epoch.
+        """
+        if token is None:
+            return None, None
+        epoch, separator, version = token.partition('.')
+        if not separator:
+            raise ValueError(f"Invalid change token: {token}")
+        return int(epoch), int(version)
+
+    def changes_since(self, since=None):
+        """
+        Returns the net changes after the `since` token (`<epoch>.<version>`).
+
+        Without `since` (or when its version is older than the retained history, newer than
+        the current version, or its epoch is not the current one) every node is returned as
+        added with `Resync` set, so the consumer can rebuild its copy.
+
+        Raises ValueError when `since` is not a token.
+        """
+        epoch, version = self.parse_token(since)
+        with self.lock:
+            oldest_base = self.deltas[0][0] - 1 if self.deltas else self.version
+            response = {'Epoch': self.epoch, 'Since': since, 'Version': f"{self.epoch}.{self.version}"}
+            if since is None or epoch != self.epoch or version < oldest_base or version > self.version:
+                response.update({'Resync': True, 'Added': list(self.nodes.values()), 'Removed': [], 'Modified': []})
+                return response
+
+            # Fold the deltas into one net change per node
+            states = {}
+            for delta_version, added, removed, modified in self.deltas:
+                if delta_version <= version:
+                    continue
+                for node_id, node in added.items():
+                    previous = states.get(node_id)
+                    states[node_id] = ('Modified' if previous and previous[0] == 'Removed' else 'Added', node)
+                for node_id in removed:
+                    previous = states.get(node_id)
+                    if previous and previous[0] == 'Added':
+                        del states[node_id]
+                    else:
+                        states[node_id] = ('Removed', node_id)
+                for node_id, node in modified.items():
+                    previous = states.get(node_id)
+                    states[node_id] = ('Added' if previous and previous[0] == 'Added' else 'Modified', node)
+
+            response.update({'Resync': False, 'Added': [], 'Removed': [], 'Modified': []})
+            for change, value in states.values():
+                response[change].append(value)
+            return response
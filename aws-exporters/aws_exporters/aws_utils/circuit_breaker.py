@@ -0,0 +1,87 @@
+"""
+circuit_breaker.py
+
+Metadata:
+
+- Author: Hideki.M (Y29udGFjdC1tZUBhd3M0Lm1lLnVrCg==)
+- Version: 1.0.0+ts1.coldasyou
+- Last Updated: 2026-10-19
+- License: MIT
+
+Circuit breaker for accounts that keep failing during multi-account crawls.
+
+An account with a missing permission set, an SCP deny or persistent throttling fails the
+same way on every refresh. After `threshold` consecutive failures the account is skipped
+for a backoff period that doubles with every further failure (up to `max_backoff`).
+When the period is over, a single attempt is let through; a success closes the breaker.
+
+Classes included:
+- CircuitBreaker: Per-key consecutive-failure counter with exponential backoff.
+"""
+
+import threading
+import time
+
+### GLOBAL VARIABLES -------------------------------------------
+default_breaker_threshold = 3
+default_breaker_backoff = 300  # 5 minutes
+default_breaker_max_backoff = 21600  # 6 hours
+
+###-------------------------------------------------------------
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures per key (e.g. account ID).
+
+    Parameters:
+    - threshold (int): Consecutive failures before the breaker opens (0 disables it).
+    - backoff (int): Seconds the breaker stays open after reaching the threshold.
+    - max_backoff (int): Upper bound of the (doubling) open period in seconds.
+    """
+
+    def __init__(self, threshold=default_breaker_threshold, backoff=default_breaker_backoff, max_backoff=default_breaker_max_backoff):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = {}    # key -> consecutive failures
+        self.open_until = {}  # key -> epoch seconds
+        self.last_errors = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key, now=None):
+        """
+        Returns False while the breaker of `key` is open.
+        """
+        now = now or time.time()
+        with self.lock:
+            return self.open_until.get(key, 0) <= now
+
+    def record_success(self, key):
+        with self.lock:
+            self.failures.pop(key, None)
+            self.open_until.pop(key, None)
+            self.last_errors.pop(key, None)
+
+    def record_failure(self, key, error=None, now=None):
+        now = now or time.time()
+        with self.lock:
+            failures = self.failures.get(key, 0) + 1
+            self.failures[key] = failures
+            self.last_errors[key] = str(error) if error else None
+            if self.threshold and failures >= self.threshold:
+                backoff = min(self.backoff * 2 ** (failures - self.threshold), self.max_backoff)
+                self.open_until[key] = now + backoff
+            return failures
+
+    def stats(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            return {
+                key: {
+                    'ConsecutiveFailures': failures,
+                    'Open': self.open_until.get(key, 0) > now,
+                    'RetryAt': self.open_until.get(key),
+                    'LastError': self.last_errors.get(key),
+                }
+                for key, failures in self.failures.items()
+            }
@@ -0,0 +1,242 @@
+"""
+policy_index.py
+
+Metadata:
+
+- Author: Hideki.M (Y29udGFjdC1tZUBhd3M0Lm1lLnVrCg==)
+- Version: 1.0.0+ts1.coldasyou
+- Last Updated: 2026-10-19
+- License: MIT
+
+Searchable index over the statements of IAM policy documents.
+
+Policy documents in `get_account_authorization_details` output may arrive as URL-encoded
+JSON strings. This module decodes and normalizes every statement once and keeps an
+inverted index by effect and action, so questions such as "which roles allow
+`iam:PassRole` on `*`" are answered from memory. Wildcard actions in statements
+(`iam:*`, `iam:Pass*`, `*`) are bucketed by service prefix and expanded at query time,
+so they match every concrete action they cover, including ones never seen in a document.
+Users, groups and roles only reference their managed policies (`AttachedManagedPolicies`);
+given the managed policies, each of their statements is attributed to every entity it is
+attached to.
+
+Functions/Classes included:
+- decode_policy_document: Decodes a (possibly URL-encoded) policy document.
+- managed_policy_statements: Returns the normalized statements of a managed policy's default version.
+- iter_policy_statements: Yields the normalized statements of one account's authorization details.
+- PolicyIndex: Inverted index over the normalized statements.
+"""
+
+import json
+from fnmatch import fnmatchcase
+from urllib.parse import unquote
+
+### GLOBAL VARIABLES -------------------------------------------
+# Where inline and managed policies live in the get_account_authorization_details output
+# (detail list -> (entity type, name field, ARN field, nested policy list))
+POLICY_ENTITIES = {
+    'UserDetailList': ('User', 'UserName', 'Arn', 'UserPolicyList'),
+    'GroupDetailList': ('Group', 'GroupName', 'Arn', 'GroupPolicyList'),
+    'RoleDetailList': ('Role', 'RoleName', 'Arn', 'RolePolicyList'),
+}
+
+###-------------------------------------------------------------
+
+# Function to decode a policy document (dict, JSON string or URL-encoded JSON string)
+def decode_policy_document(document):
+    if isinstance(document, dict):
+        return document
+    if not isinstance(document, str) or not document:
+        return None
+    for candidate in (document, unquote(document)):
+        try:
+            decoded = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(decoded, dict):
+            return decoded
+    return None
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _normalize_statements(document):
+    document = decode_policy_document(document)
+    if not document:
+        return
+    for statement in _as_list(document.get('Statement')):
+        if not isinstance(statement, dict):
+            continue
+        yield {
+            'Sid': statement.get('Sid'),
+            'Effect': statement.get('Effect', 'Allow'),
+            'Action': _as_list(statement.get('Action')),
+            'NotAction': _as_list(statement.get('NotAction')),
+            'Resource': _as_list(statement.get('Resource')),
+            'NotResource': _as_list(statement.get('NotResource')),
+            'Condition': statement.get('Condition'),
+        }
+
+# Function to get the normalized statements of a managed policy (only the default version is in effect)
+def managed_policy_statements(policy):
+    for version in policy.get('PolicyVersionList') or []:
+        if version.get('IsDefaultVersion'):
+            return list(_normalize_statements(version.get('Document')))
+    return []
+
+# Function to walk the normalized statements of one account's authorization details
+# (attached_statements maps a managed policy ARN to its statements, to resolve attachments)
+def iter_policy_statements(auth_details, attached_statements=None):
+    account_id = auth_details.get('AccountID')
+    for list_key, (entity_type, name_field, arn_field, policy_list_key) in POLICY_ENTITIES.items():
+        for entity in auth_details.get(list_key) or []:
+            if not isinstance(entity, dict):
+                continue
+            for policy in entity.get(policy_list_key) or []:
+                for statement in _normalize_statements(policy.get('PolicyDocument')):
+                    yield dict(statement, AccountID=account_id, EntityType=entity_type, EntityName=entity.get(name_field),
+                               EntityArn=entity.get(arn_field), PolicyName=policy.get('PolicyName'), PolicySource='Inline')
+            if not attached_statements:
+                continue
+            for attached in entity.get('AttachedManagedPolicies') or []:
+                for statement in attached_statements(attached.get('PolicyArn')):
+                    yield dict(statement, AccountID=account_id, EntityType=entity_type, EntityName=entity.get(name_field),
+                               EntityArn=entity.get(arn_field), PolicyName=attached.get('PolicyName'), PolicySource='Managed',
+                               PolicyArn=attached.get('PolicyArn'))
+
+    # Managed policies themselves
+    for policy in auth_details.get('Policies') or []:
+        if not isinstance(policy, dict):
+            continue
+        for statement in managed_policy_statements(policy):
+            yield dict(statement, AccountID=account_id, EntityType='Policy', EntityName=policy.get('PolicyName'),
+                       EntityArn=policy.get('Arn'), PolicyName=policy.get('PolicyName'), PolicySource='Managed',
+                       AttachmentCount=policy.get('AttachmentCount'))
+
+class PolicyIndex:
+    """
+    Inverted index over normalized policy statements, built once per refresh.
+
+    Statements are indexed by effect and lower-cased action. Concrete actions are looked up
+    directly; wildcard actions are kept per service prefix (or in a global bucket for `*`)
+    and matched with the queried action. `NotAction` statements are matched by exclusion.
+    Resources are matched at query time: a statement matches when one of its resource
+    patterns covers the queried resource (so `resource=*` finds statements on `*` only).
+
+    Parameters:
+    - all_auth_details (list): Per-account authorization details.
+    - managed_policies (dict, optional): Managed policy ARN -> policy (as in the `Policies` list),
+      used to attribute attached managed policies to users, groups and roles.
+    """
+
+    def __init__(self, all_auth_details=(), managed_policies=None):
+        self.statements = []
+        self.exact = {}      # (effect, action) -> [statement index]
+        self.patterns = {}   # (effect, service) -> [(pattern, statement index)]; service '*' for global wildcards
+        self.not_action = {} # effect -> [statement index]
+
+        # Each managed policy is decoded once, however many entities (and accounts) attach it
+        decoded = {}
+        def attached_statements(arn):
+            if arn not in decoded:
+                policy = managed_policies.get(arn)
+                decoded[arn] = managed_policy_statements(policy) if policy else []
+            return decoded[arn]
+
+        for auth_details in all_auth_details:
+            for statement in iter_policy_statements(auth_details, attached_statements if managed_policies else None):
+                self.add(statement)
+
+    def add(self, statement):
+        position = len(self.statements)
+        self.statements.append(statement)
+        effect = statement['Effect']
+        if statement['NotAction']:
+            self.not_action.setdefault(effect, []).append(position)
+        for action in statement['Action']:
+            action = str(action).lower()
+            if '*' in action or '?' in action:
+                service = action.split(':', 1)[0] if ':' in action else '*'
+                if '*' in service or '?' in service:
+                    service = '*'
+                self.patterns.setdefault((effect, service), []).append((action, position))
+            else:
+                self.exact.setdefault((effect, action), []).append(position)
+
+    def _positions_for_action(self, effect, action):
+        positions = set(self.exact.get((effect, action), []))
+        service = action.split(':', 1)[0]
+        for bucket in (service, '*'):
+            positions.update(position for pattern, position in self.patterns.get((effect, bucket), []) if fnmatchcase(action, pattern))
+        for position in self.not_action.get(effect, []):
+            if not any(fnmatchcase(action, str(pattern).lower()) for pattern in self.statements[position]['NotAction']):
+                positions.add(position)
+        return positions
+
+    def _positions_for_action_pattern(self, effect, query):
+        # A wildcard query matches every statement action it covers, and every statement pattern covering it
+        positions = set()
+        for (entry_effect, action), entry_positions in self.exact.items():
+            if entry_effect == effect and fnmatchcase(action, query):
+                positions.update(entry_positions)
+        for (entry_effect, _), entries in self.patterns.items():
+            if entry_effect == effect:
+                positions.update(position for pattern, position in entries if fnmatchcase(query, pattern) or fnmatchcase(pattern, query))
+        # NotAction statements match unless their exclusions cover the whole query
+        for position in self.not_action.get(effect, []):
+            if not any(fnmatchcase(query, str(pattern).lower()) for pattern in self.statements[position]['NotAction']):
+                positions.add(position)
+        return positions
+
+    @staticmethod
+    def _matches_resource(statement, resource):
+        if statement['NotResource']:
+            return not any(fnmatchcase(resource, str(pattern)) for pattern in statement['NotResource'])
+        return any(fnmatchcase(resource, str(pattern)) for pattern in statement['Resource'])
+
+    def search(self, action=None, resource=None, effect=None, account_ids=None, entity_type=None):
+        """
+        Returns the statements matching every given criterion.
+
+        Parameters:
+        - action (str, optional): Action such as `iam:PassRole` (case-insensitive; may itself contain wildcards).
+        - resource (str, optional): Resource ARN, or `*`.
+        - effect (str, optional): 'Allow' or 'Deny' (default: both).
+        - account_ids (list, optional): Limit to these accounts.
+        - entity_type (str, optional): 'User', 'Group', 'Role' or 'Policy'.
+
+        Returns:
+        - list: Matching statement records.
+        """
+        effects = [effect] if effect else ['Allow', 'Deny']
+        if action:
+            action = action.lower()
+            positions = set()
+            for entry_effect in effects:
+                if '*' in action or '?' in action:
+                    positions.update(self._positions_for_action_pattern(entry_effect, action))
+                else:
+                    positions.update(self._positions_for_action(entry_effect, action))
+        else:
+            positions = {position for position, statement in enumerate(self.statements) if statement['Effect'] in effects}
+
+        results = []
+        for position in sorted(positions):
+            statement = self.statements[position]
+            if resource and not self._matches_resource(statement, resource):
+                continue
+            if account_ids is not None and statement['AccountID'] not in account_ids:
+                continue
+            if entity_type and statement['EntityType'] != entity_type:
+                continue
+            results.append(statement)
+        return results
+
+    def stats(self):
+        return {
+            'Statements': len(self.statements),
+            'Actions': len(self.exact),
+            'WildcardPatterns': sum(len(entries) for entries in self.patterns.values()),
+        }
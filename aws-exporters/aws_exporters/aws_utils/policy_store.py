@@ -0,0 +1,177 @@
+"""
+policy_store.py
+
+Metadata:
+
+- Author: Hideki.M (Y29udGFjdC1tZUBhd3M0Lm1lLnVrCg==)
+- Version: 1.0.0+ts1.coldasyou
+- Last Updated: 2026-10-19
+- License: MIT
+
+Content-addressed store for IAM policy documents.
+
+AWS managed policies are byte-for-byte identical in every account, and customer
+policies deployed by StackSets are too. This module hashes each document found in
+`get_account_authorization_details` output, keeps a single copy per digest and lets
+every entity record point at that shared copy.
+
+Functions/Classes included:
+- policy_digest: Returns the content address (sha256) of a policy document.
+- iter_policy_documents: Yields every (record, field) holding a policy document.
+- PolicyStore: Interns documents per cache owner and builds deduplicated views.
+"""
+
+import hashlib
+import json
+import threading
+
+### GLOBAL VARIABLES -------------------------------------------
+# Where policy documents live in the get_account_authorization_details output
+# (detail list -> [(nested list or None for the record itself, document field)])
+POLICY_DOCUMENT_FIELDS = {
+    'UserDetailList': [('UserPolicyList', 'PolicyDocument')],
+    'GroupDetailList': [('GroupPolicyList', 'PolicyDocument')],
+    'RoleDetailList': [('RolePolicyList', 'PolicyDocument'), (None, 'AssumeRolePolicyDocument')],
+    'Policies': [('PolicyVersionList', 'Document')],
+}
+
+###-------------------------------------------------------------
+
+# Function to get the content address of a policy document
+def policy_digest(document):
+    if isinstance(document, str):
+        canonical = document
+    else:
+        canonical = json.dumps(document, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# Function to walk every policy document in one account's authorization details
+def iter_policy_documents(auth_details):
+    for list_key, locations in POLICY_DOCUMENT_FIELDS.items():
+        for entry in auth_details.get(list_key) or []:
+            if not isinstance(entry, dict):
+                continue
+            for nested_key, field in locations:
+                records = [entry] if nested_key is None else (entry.get(nested_key) or [])
+                for record in records:
+                    if isinstance(record, dict) and record.get(field) is not None:
+                        yield record, field
+
+class PolicyStore:
+    """
+    Keeps one copy of each distinct policy document, keyed by its sha256 digest.
+
+    Each owner (a cache key such as the `filter_type`) binds the set of digests its
+    cached data refers to. Documents that no owner refers to any more are dropped,
+    so the store scales with unique policies rather than accounts x policies.
+
+    The shared documents are the objects the cached entries refer to, so they are already
+    counted by the cache's byte budget. Do not intern entries that the cache keeps
+    compressed: the decoded documents would be held outside that budget.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.digests_by_id = {}
+        self.owners = {}
+        self.lock = threading.Lock()
+
+    def intern(self, document):
+        """
+        Returns (digest, shared_document) for the given document, storing it if new.
+        """
+        digest = policy_digest(document)
+        with self.lock:
+            shared = self.documents.setdefault(digest, document)
+            self.digests_by_id[id(shared)] = digest
+        return digest, shared
+
+    def intern_auth_details(self, owner, all_auth_details):
+        """
+        Replaces every policy document in the given account list with its shared copy (in place).
+
+        Parameters:
+        - owner (str): Cache key the account list is stored under.
+        - all_auth_details (list): Per-account get_account_authorization_details output.
+
+        Returns:
+        - list: The same list, now referencing interned documents.
+        """
+        digests = set()
+        for auth_details in all_auth_details:
+            for record, field in iter_policy_documents(auth_details):
+                digest, shared = self.intern(record[field])
+                record[field] = shared
+                digests.add(digest)
+
+        with self.lock:
+            self.owners[owner] = digests
+            self._prune()
+        return all_auth_details
+
+    def release(self, owner):
+        with self.lock:
+            self.owners.pop(owner, None)
+            self._prune()
+
+    def _prune(self):
+        live = set().union(*self.owners.values()) if self.owners else set()
+        for digest in [d for d in self.documents if d not in live]:
+            self.digests_by_id.pop(id(self.documents.pop(digest)), None)
+
+    def dedup_view(self, all_auth_details):
+        """
+        Builds a deduplicated response: a document table plus entity records holding references.
+
+        Every document field `<Field>` is replaced by `<Field>Ref` carrying the digest.
+        The cached data itself is left untouched; only the records on the path to a
+        document are copied.
+
+        Returns:
+        - dict: {'PolicyDocuments': {digest: document}, 'AccountAuthorizationDetails': [...]}
+        """
+        documents = {}
+        accounts = []
+        for auth_details in all_auth_details:
+            account_view = dict(auth_details)
+            for list_key, locations in POLICY_DOCUMENT_FIELDS.items():
+                if not auth_details.get(list_key):
+                    continue
+                entries = []
+                for entry in auth_details[list_key]:
+                    if not isinstance(entry, dict):
+                        entries.append(entry)
+                        continue
+                    entry_view = dict(entry)
+                    for nested_key, field in locations:
+                        if nested_key is None:
+                            self._replace_with_ref(entry_view, field, documents)
+                        elif entry.get(nested_key):
+                            nested = []
+                            for record in entry[nested_key]:
+                                record_view = dict(record) if isinstance(record, dict) else record
+                                if isinstance(record_view, dict):
+                                    self._replace_with_ref(record_view, field, documents)
+                                nested.append(record_view)
+                            entry_view[nested_key] = nested
+                    entries.append(entry_view)
+                account_view[list_key] = entries
+            accounts.append(account_view)
+
+        return {'PolicyDocuments': documents, 'AccountAuthorizationDetails': accounts}
+
+    def _replace_with_ref(self, record, field, documents):
+        if record.get(field) is None:
+            return
+        document = record.pop(field)
+        # Interned documents are shared objects, so their digest is already known
+        digest = self.digests_by_id.get(id(document)) or policy_digest(document)
+        documents.setdefault(digest, document)
+        record[f"{field}Ref"] = digest
+
+    def stats(self):
+        with self.lock:
+            return {
+                'UniqueDocuments': len(self.documents),
+                'Owners': {owner: len(digests) for owner, digests in self.owners.items()},
+            }
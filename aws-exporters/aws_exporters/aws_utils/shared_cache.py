@@ -0,0 +1,396 @@
+"""
+shared_cache.py
+
+Metadata:
+
+- Author: Hideki.M (Y29udGFjdC1tZUBhd3M0Lm1lLnVrCg==)
+- Version: 1.0.0+ts1.coldasyou
+- Last Updated: 2026-10-19
+- License: MIT
+
+Shared cache and crawl leader election across exporter replicas.
+
+Replicas behind a load balancer used to crawl AWS independently, multiplying API calls
+and throttling by the replica count. With a shared backend, a replica whose local entry
+has expired first looks for a fresher result published by another replica. Only the
+replica holding the key's lease (the leader) crawls and publishes; the others serve the
+last published result (stale while the leader refreshes), or wait for the first one.
+
+Backends:
+- DirectoryBackend: A directory shared by the replicas (e.g. a volume); leases are
+  written to a temporary file and hard-linked into place, which fails if one exists.
+  Expired entry files are swept periodically.
+- RedisBackend: Any server speaking the Redis protocol (RESP); leases use `SET NX PX`,
+  entries `SET PX`. No client library is needed.
+
+Published entries expire `entry_ttl_factor` times their max age after they were crawled,
+so keys nobody asks for anymore (e.g. evicted or one-off queries) do not pile up.
+
+Functions/Classes included:
+- DirectoryBackend: Shared directory backend.
+- RedisBackend: Redis-protocol backend.
+- SharedCache: Lease-based leader election and publishing on top of a backend.
+- create_shared_cache: Builds a SharedCache from a URL (redis://..., file://... or a path).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from urllib.parse import urlparse, unquote
+
+### INIT CONFIGURATIONS ----------------------------------------
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+### GLOBAL VARIABLES -------------------------------------------
+default_shared_cache_lease = 600  # Longest expected crawl, in seconds
+default_shared_cache_wait = 30  # How long a replica waits for the leader's first result
+poll_interval = 1
+stale_recheck = 10  # A replica serving a stale result checks for the leader's new one this often
+entry_ttl_factor = 3  # Published entries outlive their max age, so they can still be served stale meanwhile
+sweep_interval = 300  # How often a replica removes expired entry files from a shared directory
+
+# Releases a lease only if this replica still holds it
+RELEASE_LEASE_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) else return 0 end"
+
+###-------------------------------------------------------------
+
+class DirectoryBackend:
+    """
+    Stores entries and leases as files in a directory shared by the replicas.
+
+    Parameters:
+    - path (str): Shared directory (created if missing).
+    - namespace (str): Subdirectory per exporter, so exporters never share keys.
+    """
+
+    def __init__(self, path, namespace):
+        self.path = os.path.join(path, namespace)
+        os.makedirs(self.path, exist_ok=True)
+        self.last_sweep = 0
+
+    def _file(self, key, suffix):
+        return os.path.join(self.path, hashlib.sha256(key.encode('utf-8')).hexdigest() + suffix)
+
+    @staticmethod
+    def _expired(header, now):
+        # Entry files start with their expiry (files without a readable one are expired)
+        try:
+            return float(header) <= now
+        except ValueError:
+            return True
+
+    def get(self, key):
+        try:
+            with open(self._file(key, '.entry'), 'rb') as f:
+                header, _, payload = f.read().partition(b'\n')
+        except FileNotFoundError:
+            return None
+        return None if self._expired(header, time.time()) else payload
+
+    def set(self, key, payload, ttl):
+        # Write to a temporary file first, so readers never see a partial entry
+        now = time.time()
+        target = self._file(key, '.entry')
+        temporary = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(f"{now + ttl}\n".encode() + payload)
+        os.replace(temporary, target)
+        if now - self.last_sweep >= sweep_interval:
+            self.last_sweep = now
+            self._sweep(now)
+
+    def _sweep(self, now):
+        # Remove expired entries (an entry replaced meanwhile may be removed too, which only costs a crawl)
+        removed = 0
+        for name in os.listdir(self.path):
+            if not name.endswith('.entry'):
+                continue
+            entry = os.path.join(self.path, name)
+            try:
+                with open(entry, 'rb') as f:
+                    header = f.readline().strip()
+                if self._expired(header, now):
+                    os.unlink(entry)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            logger.info(f"🧹 Removed {removed} expired shared cache entries from {self.path}.")
+
+    def _read_lease(self, lease, ttl):
+        # Returns (content, expires_at); a lease without a readable expiry (e.g. left half-written
+        # by an older version) expires `ttl` seconds after it was last modified
+        with open(lease, 'r') as f:
+            content = f.read()
+            modified_at = os.fstat(f.fileno()).st_mtime
+        try:
+            return content, float(content.rsplit(' ', 1)[1])
+        except (IndexError, ValueError):
+            return content, modified_at + ttl
+
+    def acquire_lease(self, key, owner, ttl):
+        lease = self._file(key, '.lease')
+        now = time.time()
+        # Write owner and expiry first and link the complete file into place, so a lease is never seen half-written
+        temporary = f"{lease}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, 'w') as f:
+            f.write(f"{owner} {now + ttl}")
+        try:
+            for _ in range(2):
+                try:
+                    os.link(temporary, lease)
+                    return True
+                except FileExistsError:
+                    pass
+                try:
+                    content, expires_at = self._read_lease(lease, ttl)
+                except FileNotFoundError:
+                    continue
+                if expires_at > now:
+                    return False
+                # Expired lease (its holder died): move it away, then check it is the one just read,
+                # since another replica may have taken it over in the meantime
+                expired = f"{lease}.{uuid.uuid4().hex}.expired"
+                try:
+                    os.rename(lease, expired)
+                except FileNotFoundError:
+                    continue
+                try:
+                    with open(expired, 'r') as f:
+                        moved = f.read()
+                    if moved != content:
+                        # Put the other replica's fresh lease back (unless yet another one was created) and give up
+                        try:
+                            os.link(expired, lease)
+                        except FileExistsError:
+                            pass
+                        return False
+                finally:
+                    os.unlink(expired)
+            return False
+        finally:
+            os.unlink(temporary)
+
+    def release_lease(self, key, owner):
+        lease = self._file(key, '.lease')
+        try:
+            with open(lease, 'r') as f:
+                holder = f.read().rsplit(' ', 1)[0]
+            if holder == owner:
+                os.unlink(lease)
+        except (FileNotFoundError, ValueError):
+            pass
+
+class RedisBackend:
+    """
+    Minimal client for a server speaking the Redis protocol (RESP2).
+
+    Parameters:
+    - url (str): redis://[:password@]host[:port][/db]
+    - namespace (str): Key prefix per exporter.
+    - timeout (float): Socket timeout in seconds.
+    """
+
+    def __init__(self, url, namespace, timeout=5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.strip('/') or 0)
+        self.prefix = f"aws-exporters:{namespace}:"
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.reader = self.sock.makefile('rb')
+        if self.password:
+            self._send('AUTH', self.password)
+        if self.db:
+            self._send('SELECT', self.db)
+
+    def _close(self):
+        try:
+            if self.sock:
+                self.sock.close()
+        finally:
+            self.sock = None
+            self.reader = None
+
+    def _send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        self.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RuntimeError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise RuntimeError(f"Unexpected reply: {line!r}")
+
+    def command(self, *args):
+        with self.lock:
+            # Reconnect once if the connection went away
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    return self._send(*args)
+                except (OSError, ConnectionError):
+                    self._close()
+                    if attempt:
+                        raise
+
+    def get(self, key):
+        return self.command('GET', self.prefix + key)
+
+    def set(self, key, payload, ttl):
+        self.command('SET', self.prefix + key, payload, 'PX', int(ttl * 1000))
+
+    def acquire_lease(self, key, owner, ttl):
+        return self.command('SET', f"{self.prefix}lease:{key}", owner, 'NX', 'PX', int(ttl * 1000)) == 'OK'
+
+    def release_lease(self, key, owner):
+        self.command('EVAL', RELEASE_LEASE_SCRIPT, 1, f"{self.prefix}lease:{key}", owner)
+
+class SharedCache:
+    """
+    Publishes cache entries to a shared backend and elects one replica per key to refresh it.
+
+    Parameters:
+    - backend: DirectoryBackend or RedisBackend.
+    - lease_ttl (int): Seconds a leader holds a key's lease (should exceed the longest crawl).
+    - wait (int): Seconds a replica without any result waits for the leader before crawling itself.
+    - dumps (callable, optional): Serializer returning a JSON string. Defaults to json.dumps.
+
+    Values read from the backend are JSON round-tripped, so datetimes come back as strings.
+    """
+
+    def __init__(self, backend, lease_ttl=default_shared_cache_lease, wait=default_shared_cache_wait, dumps=None):
+        self.backend = backend
+        self.lease_ttl = lease_ttl
+        self.wait = wait
+        self.dumps = dumps or (lambda value: json.dumps(value, default=str))
+        self.replica_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stats_counters = {'Published': 0, 'Reused': 0, 'ServedStale': 0, 'Waited': 0, 'BuiltLocally': 0, 'BackendErrors': 0}
+
+    def _read(self, key):
+        payload = self.backend.get(key)
+        if not payload:
+            return None, None
+        header, _, body = payload.partition(b'\n')
+        return json.loads(body), float(header)
+
+    def _publish(self, key, value, fetched_time, max_age):
+        self.backend.set(key, f"{fetched_time}\n".encode() + self.dumps(value).encode('utf-8'), max(max_age, stale_recheck) * entry_ttl_factor)
+        self.stats_counters['Published'] += 1
+
+    def fetch(self, key, current_time, max_age, build, min_time=0, wait=None, publish=None):
+        """
+        Returns (value, fetched_time, source_time) for `key`, crawling only if this replica is the leader.
+
+        `fetched_time` is the time to record for the local copy (it expires a stale result in a
+        few seconds), `source_time` the time the value was crawled (by any replica).
+
+        Parameters:
+        - key (str): Cache key.
+        - current_time (float): Request time.
+        - max_age (int): Seconds a published result stays fresh.
+        - build (callable): Crawls and returns the value (None on failure).
+        - min_time (float, optional): Published results older than this are not fresh.
+        - wait (float, optional): Caps how long to wait for the leader's first result (e.g. a crawl deadline).
+        - publish (callable, optional): Whether a built value is shared with the other replicas
+          (e.g. not when the crawl was cut short). Defaults to every non-empty value.
+        """
+        # Only the backend calls are guarded: a crawl that raises must fail once, not be retried as a backend error
+        leader = False
+        try:
+            value, fetched_time = self._read(key)
+            if value is not None and (current_time - fetched_time) < max_age and fetched_time >= min_time:
+                logger.info(f"↩️  Reusing '{key}' published by another replica.")
+                self.stats_counters['Reused'] += 1
+                return value, fetched_time, fetched_time
+
+            leader = self.backend.acquire_lease(key, self.replica_id, self.lease_ttl)
+            if not leader:
+                # Another replica is refreshing: serve its last result, or wait for the first one
+                if value is not None:
+                    self.stats_counters['ServedStale'] += 1
+                    # Report a time that expires the local copy in a few seconds, not on every request
+                    return value, max(fetched_time, current_time - max_age + stale_recheck), fetched_time
+                wait = self.wait if wait is None else min(wait, self.wait)
+                deadline = time.time() + wait
+                while time.time() < deadline:
+                    time.sleep(poll_interval)
+                    value, fetched_time = self._read(key)
+                    if value is not None and fetched_time >= min_time:
+                        self.stats_counters['Waited'] += 1
+                        return value, fetched_time, fetched_time
+                logger.warning(f"⚠️  No result for '{key}' from the leader after {wait}s, crawling locally.")
+                self.stats_counters['BuiltLocally'] += 1
+        except Exception as e:
+            # The shared backend is an optimization, never a single point of failure
+            logger.error(f"❌ Shared cache backend error for '{key}', crawling locally: {e}")
+            self.stats_counters['BackendErrors'] += 1
+
+        if not leader:
+            return build(), current_time, current_time
+
+        try:
+            value = build()
+            if value and (publish is None or publish(value)):
+                try:
+                    self._publish(key, value, current_time, max_age)
+                except Exception as e:
+                    logger.error(f"❌ Failed to publish '{key}' to the shared cache: {e}")
+                    self.stats_counters['BackendErrors'] += 1
+            return value, current_time, current_time
+        finally:
+            try:
+                self.backend.release_lease(key, self.replica_id)
+            except Exception as e:
+                logger.error(f"❌ Failed to release the lease of '{key}': {e}")
+
+    def stats(self):
+        return dict(self.stats_counters, Backend=type(self.backend).__name__, ReplicaId=self.replica_id, LeaseTTL=self.lease_ttl)
+
+# Function to build a shared cache from a URL (redis://host:port/db, file:///path or a plain path)
+def create_shared_cache(url, namespace, lease_ttl=default_shared_cache_lease, wait=default_shared_cache_wait, dumps=None):
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://')):
+        if url.startswith('rediss://'):
+            raise ValueError("TLS (rediss://) is not supported by the built-in Redis-protocol client")
+        backend = RedisBackend(url, namespace)
+    else:
+        backend = DirectoryBackend(unquote(urlparse(url).path) if url.startswith('file://') else url, namespace)
+    logger.info(f"🔗 Sharing the cache through {type(backend).__name__} ({url}).")
+    return SharedCache(backend, lease_ttl, wait, dumps)
@@ -0,0 +1,159 @@
+"""
+usage_history.py
+
+Metadata:
+
+- Author: Hideki.M (Y29udGFjdC1tZUBhd3M0Lm1lLnVrCg==)
+- Version: 1.0.0+ts1.coldasyou
+- Last Updated: 2026-10-19
+- License: MIT
+
+Local history of AWS Free Tier usage snapshots.
+
+Every refreshed `freeTierUsages` snapshot is appended to a SQLite file. Raw samples are
+downsampled to one sample per day once they are older than `raw_days`, and everything
+older than `retention_days` is dropped, so trend panels can be served locally without
+polling AWS or paying for Cost Explorer.
+
+Classes included:
+- UsageHistoryStore: Append-only SQLite store with retention, downsampling and range queries.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+### INIT CONFIGURATIONS ----------------------------------------
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+### GLOBAL VARIABLES -------------------------------------------
+default_history_retention_days = 400
+default_history_raw_days = 7
+maintenance_interval = 3600  # Seconds between retention/downsampling passes
+downsampled_resolution = 86400  # One sample per day
+
+###-------------------------------------------------------------
+
+class UsageHistoryStore:
+    """
+    SQLite store for free tier usage snapshots.
+
+    Parameters:
+    - path (str): SQLite database file.
+    - retention_days (int): Samples older than this are deleted.
+    - raw_days (int): Samples older than this are downsampled to one per day (max of each value).
+    """
+
+    def __init__(self, path, retention_days=default_history_retention_days, raw_days=default_history_raw_days):
+        self.path = path
+        self.retention_days = retention_days
+        self.raw_days = raw_days
+        self.last_maintenance = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS free_tier_usage (
+                    ts INTEGER NOT NULL,
+                    resolution INTEGER NOT NULL,
+                    service TEXT NOT NULL,
+                    usage_type TEXT NOT NULL,
+                    region TEXT NOT NULL,
+                    operation TEXT NOT NULL,
+                    actual REAL,
+                    forecasted REAL,
+                    usage_limit REAL,
+                    unit TEXT
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_free_tier_usage_series ON free_tier_usage (service, usage_type, ts)")
+
+    def append(self, free_tier_usages, timestamp=None):
+        """
+        Appends one snapshot (the `freeTierUsages` list) taken at `timestamp` (epoch seconds).
+        """
+        timestamp = int(timestamp or time.time())
+        rows = [
+            (
+                timestamp, 0,
+                usage.get('service', ''), usage.get('usageType', ''), usage.get('region', ''), usage.get('operation', ''),
+                usage.get('actualUsageAmount'), usage.get('forecastedUsageAmount'), usage.get('limit'), usage.get('unit'),
+            )
+            for usage in free_tier_usages
+        ]
+        with self.lock:
+            with self.conn:
+                self.conn.executemany("INSERT INTO free_tier_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if timestamp - self.last_maintenance >= maintenance_interval:
+                self._maintain(timestamp)
+                self.last_maintenance = timestamp
+        logger.info(f"🗄️  Stored {len(rows)} free tier usage samples in {self.path}.")
+
+    def _maintain(self, now):
+        retention_cutoff = now - self.retention_days * 86400
+        raw_cutoff = now - self.raw_days * 86400
+        # Align to whole days so a day is only downsampled once it is complete
+        raw_cutoff -= raw_cutoff % downsampled_resolution
+        with self.conn:
+            self.conn.execute("DELETE FROM free_tier_usage WHERE ts < ?", (retention_cutoff,))
+            self.conn.execute("""
+                INSERT INTO free_tier_usage
+                SELECT (ts / :res) * :res, :res, service, usage_type, region, operation,
+                       MAX(actual), MAX(forecasted), MAX(usage_limit), MAX(unit)
+                FROM free_tier_usage
+                WHERE resolution = 0 AND ts < :cutoff
+                GROUP BY ts / :res, service, usage_type, region, operation
+            """, {'res': downsampled_resolution, 'cutoff': raw_cutoff})
+            self.conn.execute("DELETE FROM free_tier_usage WHERE resolution = 0 AND ts < ?", (raw_cutoff,))
+
+    def query(self, start, end, service=None, usage_type=None, region=None, step=None):
+        """
+        Returns the usage history per service/usageType/region between `start` and `end` (epoch seconds).
+
+        Parameters:
+        - step (int, optional): Bucket size in seconds; each bucket reports the max of its samples.
+
+        Returns:
+        - list: [{'service', 'usageType', 'region', 'operation', 'unit', 'Samples': [{'Timestamp', 'actualUsageAmount', 'forecastedUsageAmount', 'limit'}]}]
+        """
+        step = max(int(step or 1), 1)
+        conditions = ["ts >= ?", "ts <= ?"]
+        params = [int(start), int(end)]
+        for column, value in [('service', service), ('usage_type', usage_type), ('region', region)]:
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+
+        sql = f"""
+            SELECT (ts / {step}) * {step} AS bucket, service, usage_type, region, operation,
+                   MAX(actual), MAX(forecasted), MAX(usage_limit), MAX(unit)
+            FROM free_tier_usage
+            WHERE {' AND '.join(conditions)}
+            GROUP BY bucket, service, usage_type, region, operation
+            ORDER BY service, usage_type, region, operation, bucket
+        """
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        series = {}
+        for bucket, row_service, row_usage_type, row_region, operation, actual, forecasted, limit, unit in rows:
+            key = (row_service, row_usage_type, row_region, operation)
+            if key not in series:
+                series[key] = {
+                    'service': row_service,
+                    'usageType': row_usage_type,
+                    'region': row_region,
+                    'operation': operation,
+                    'unit': unit,
+                    'Samples': [],
+                }
+            series[key]['Samples'].append({
+                'Timestamp': bucket,
+                'actualUsageAmount': actual,
+                'forecastedUsageAmount': forecasted,
+                'limit': limit,
+            })
+        return list(series.values())
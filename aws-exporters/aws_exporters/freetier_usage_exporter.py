@@ -9,6 +9,16 @@ Metadata:
 
 Description:
 This script retrieves and exports information about AWS Free Tier, it's part of AWS Billing and Cost Management.
+Cost Explorer daily usage is kept per usage type and day; days older than the restatement window
+are final and never refetched, so each refresh only queries the trailing few days. All requested
+usage types are fetched in one GroupBy USAGE_TYPE call, and `group_by=usage_type` returns a series
+per usage type along with the total.
+Filters on `/freetier` (service, region, usage_type, min_percent) are pushed down into the
+GetFreeTierUsage filter expression when the cache is cold and answered from an index over
+the cached snapshot when it is warm.
+Each refresh also ranks the entries by projected month-end usage (`/freetier/forecast`).
+With --history-db, every refreshed free tier snapshot is also appended to a local SQLite
+history served by `/freetier/history`.
 
 Usage:
     python freetier_usage_exporter.py --mgmt-account-id <management_account_id> --permission-set-name <permission_set_name> --sso-region <sso_region> [--port <port>] [--cache-expiry <cache_expiry>] [--cache-expiry <cache_expiry>] [--access-token <valid_sso_access_token>]
@@ -17,15 +27,23 @@ Usage:
 
 import boto3
 import json
+import re
 import argparse
 import os
 import time
 import logging
+import threading
+from collections import OrderedDict
 from flask import Flask, jsonify, request
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from botocore.exceptions import ClientError
 #from aws_utils.aws_utils import create_session # For Directory Structure
-from aws_exporters.aws_utils import create_session
+from aws_exporters.aws_utils import (
+    create_session, UsageHistoryStore, default_history_retention_days, default_history_raw_days,
+    CacheStore, cached_response, create_shared_cache, default_shared_cache_lease,
+    default_shared_cache_wait, COMPRESSION_CHOICES, EVICTION_CHOICES, default_hot_entries,
+    default_cache_max_bytes,
+)
 
 ### INIT CONFIGURATIONS ----------------------------------------
 # Configure logging
@@ -35,75 +53,178 @@ logger = logging.getLogger(__name__)
 #logger.info("🚨 logger: %s", logger)
 
 ### GLOBAL VARIABLES -------------------------------------------
-cache = {}
+cache = CacheStore()
 cache_times = {}
 default_cache_expiry = 1800  # 30 minutes
 valid_sso_access_token = None
+# Cost Explorer daily usage, shared by every request, (usage type, day) -> (amount, fetched on, fetched at)
+cost_usage_store = {}
+cost_usage_lock = threading.Lock()
+# Usage types held in the store, least recently requested first (the store keeps at most ce_max_usage_types)
+cost_usage_types = OrderedDict()
+default_ce_restatement_days = 3  # Days AWS may still restate, refetched once they are older than the cache expiry
+default_ce_store_retention_days = 93
+ce_restatement_days = default_ce_restatement_days
+ce_store_retention_days = default_ce_store_retention_days
+default_ce_max_usage_types = 200
+ce_max_usage_types = default_ce_max_usage_types
+usage_history = None
+free_tier_index = None
 
 ###-------------------------------------------------------------
 
 app = Flask(__name__)
 
-# Function to get cost and usage data from AWS Cost Explorer
-def get_cost_and_usage(usage_types, time_periods=None, mgmt_account_id=None, permission_set_name=None, sso_region=None, valid_sso_access_token=None):
-
-    # Create a Boto3 client for the FreeTier
-    client = create_session(mgmt_account_id, permission_set_name, sso_region, "ce", valid_sso_access_token)
-
-    if not client:
-        return None
-
+# Function to get the requested [start, end) date range (defaults to month-to-date)
+def get_date_range(time_periods=None):
     if not time_periods:
         today = datetime.now(timezone.utc).date()
-        first_day_of_month = today.replace(day=1)
-        start_date = first_day_of_month.strftime('%Y-%m-%d')
-        end_date = today.strftime('%Y-%m-%d')
-    else:
-        time_period_list = [time_period.strip() for time_period in time_periods.split(',')]
-        start_date = time_period_list[0]
-        end_date = time_period_list[1]
-
-    usage_types_list = [usage_type.strip() for usage_type in usage_types.split(',')]
-
-    try:
-        response = client.get_cost_and_usage(
-            TimePeriod={
-                'Start': start_date,
-                'End': end_date
+        return today.replace(day=1), today
+
+    time_period_list = [time_period.strip() for time_period in time_periods.split(',')]
+    start_date = datetime.strptime(time_period_list[0], '%Y-%m-%d').date()
+    end_date = datetime.strptime(time_period_list[1], '%Y-%m-%d').date()
+    return start_date, end_date
+
+# Function to check whether a stored day can still be restated by AWS
+def is_final_day(day, fetched_on):
+    return (fetched_on - day).days > ce_restatement_days
+
+# Function to check whether a stored day has to be queried again (final days never, the others once expired)
+def is_stale_usage(stored, day, current_time):
+    _, fetched_on, fetched_at = stored
+    return not is_final_day(day, fetched_on) and (current_time - fetched_at) >= cache_expiry
+
+# Function to query daily usage per usage type (one GroupBy call, all pages)
+def get_usage_by_type(client, usage_types_list, start_date, end_date):
+    results_by_time = []
+    next_page_token = None
+    while True:
+        kwargs = {
+            'TimePeriod': {
+                'Start': start_date.strftime('%Y-%m-%d'),
+                'End': end_date.strftime('%Y-%m-%d')
             },
-            Granularity='DAILY',
-            Metrics=['UsageQuantity'],
-            Filter={
+            'Granularity': 'DAILY',
+            'Metrics': ['UsageQuantity'],
+            'Filter': {
                 'Dimensions': {
                     'Key': 'USAGE_TYPE',
                     'Values': usage_types_list
                 }
-            }
-        )
-
-        results_by_time = response['ResultsByTime']
-        usage_data = []
-
-        for result in results_by_time:
-            time_period = result['TimePeriod']
-            amount = result['Total']['UsageQuantity']['Amount']
-            usage_data.append({
-                'Start': time_period['Start'],
-                'End': time_period['End'],
-                'UsageAmount': amount
-            })
-
-        total_usage = sum(float(result['Total']['UsageQuantity']['Amount']) for result in results_by_time)
-        return {
-            'UsageData': usage_data,
-            'TotalUsage': total_usage
+            },
+            'GroupBy': [{'Type': 'DIMENSION', 'Key': 'USAGE_TYPE'}]
         }
-    except ClientError as e:
-        logger.error(f"❌ An unexpected error occurred: {e}")
-        return None
+        if next_page_token:
+            kwargs['NextPageToken'] = next_page_token
+        response = client.get_cost_and_usage(**kwargs)
+        results_by_time.extend(response['ResultsByTime'])
+        next_page_token = response.get('NextPageToken')
+        if not next_page_token:
+            break
+
+    usage_by_type = {}
+    for result in results_by_time:
+        day = datetime.strptime(result['TimePeriod']['Start'], '%Y-%m-%d').date()
+        for group in result.get('Groups', []):
+            usage_by_type[(group['Keys'][0], day)] = group['Metrics']['UsageQuantity']['Amount']
+    return usage_by_type
+
+# Function to build a daily series from the store
+def get_usage_series(usage_types_list, days):
+    usage_data = []
+    for day in days:
+        amounts = [cost_usage_store.get((usage_type, day), ('0', None, None))[0] for usage_type in usage_types_list]
+        usage_data.append({
+            'Start': day.strftime('%Y-%m-%d'),
+            'End': (day + timedelta(days=1)).strftime('%Y-%m-%d'),
+            'UsageAmount': amounts[0] if len(amounts) == 1 else str(sum(float(amount) for amount in amounts))
+        })
+    return {
+        'UsageData': usage_data,
+        'TotalUsage': sum(float(data['UsageAmount']) for data in usage_data)
+    }
+
+# Function to get cost and usage data from AWS Cost Explorer
+def get_cost_and_usage(usage_types, time_periods=None, mgmt_account_id=None, permission_set_name=None, sso_region=None, valid_sso_access_token=None, batched=False):
+    start_date, end_date = get_date_range(time_periods)
+    usage_types_list = sorted({usage_type.strip() for usage_type in usage_types.split(',')})
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days)]
+    current_time = time.time()
+
+    # Only (usage type, day) pairs that are missing, or inside AWS's restatement window and older than
+    # the cache expiry, need to be (re)queried, so other usage type subsets reuse the days just fetched
+    with cost_usage_lock:
+        for usage_type in usage_types_list:
+            cost_usage_types[usage_type] = current_time
+            cost_usage_types.move_to_end(usage_type)
+        pending = [
+            (usage_type, day) for usage_type in usage_types_list for day in days
+            if (usage_type, day) not in cost_usage_store or is_stale_usage(cost_usage_store[(usage_type, day)], day, current_time)
+        ]
+
+    if pending:
+        # Create a Boto3 client for the Cost Explorer
+        client = create_session(mgmt_account_id, permission_set_name, sso_region, "ce", valid_sso_access_token)
+
+        if not client:
+            return None
+
+        # One GroupBy call covers every usage type that has a pending day
+        pending_types = sorted({usage_type for usage_type, _ in pending})
+        fetch_start = min(day for _, day in pending)
+        logger.info(f"🔍 Querying Cost Explorer for {len(pending_types)} usage types from {fetch_start} to {end_date}.")
+        try:
+            usage_by_type = get_usage_by_type(client, pending_types, fetch_start, end_date)
+        except ClientError as e:
+            logger.error(f"❌ An unexpected error occurred: {e}")
+            return None
+
+        # Merge the refreshed days into the store (usage types without a group that day used nothing)
+        fetched_on = datetime.now(timezone.utc).date()
+        fetched_at = time.time()
+        with cost_usage_lock:
+            for usage_type in pending_types:
+                for day in days:
+                    if day >= fetch_start:
+                        cost_usage_store[(usage_type, day)] = (usage_by_type.get((usage_type, day), '0'), fetched_on, fetched_at)
+            cost_data = get_cost_data(usage_types_list, days, batched)
+            # Prune only after answering, and keep the requested days, so a range older than the
+            # retention period is neither answered with zeros nor re-queried on every request
+            prune_cost_usage_store(fetched_on, keep_days=set(days))
+            prune_cost_usage_types()
+        return cost_data
+
+    logger.info(f"↩️  Answering {len(usage_types_list)} usage types from the stored daily usage.")
+    with cost_usage_lock:
+        return get_cost_data(usage_types_list, days, batched)
+
+# Function to build the response from the store (plus per usage type series when batched)
+def get_cost_data(usage_types_list, days, batched=False):
+    cost_data = get_usage_series(usage_types_list, days)
+    if batched:
+        cost_data['UsageTypes'] = {usage_type: get_usage_series([usage_type], days) for usage_type in usage_types_list}
+    return cost_data
+
+# Function to drop stored days older than the retention period (except the days being answered)
+def prune_cost_usage_store(today, keep_days=()):
+    oldest_day = today - timedelta(days=ce_store_retention_days)
+    for key in [key for key in cost_usage_store if key[1] < oldest_day and key[1] not in keep_days]:
+        del cost_usage_store[key]
+
+# Function to drop the least recently requested usage types beyond the cap (a request never asks for more)
+def prune_cost_usage_types():
+    dropped = set()
+    while len(cost_usage_types) > ce_max_usage_types:
+        usage_type, _ = cost_usage_types.popitem(last=False)
+        dropped.add(usage_type)
+    if dropped:
+        logger.info(f"🧹 Dropping the stored daily usage of {len(dropped)} least recently requested usage types.")
+        for key in [key for key in cost_usage_store if key[0] in dropped]:
+            del cost_usage_store[key]
 
 # Main function to get free_tier_usage from Mmgt. account
-def get_free_tier_usage(mgmt_account_id, permission_set_name, sso_region):
+def get_free_tier_usage(mgmt_account_id, permission_set_name, sso_region, filter_expression=None):
     # Create a Boto3 client for the FreeTier
     client = create_session(mgmt_account_id, permission_set_name, sso_region, "freetier", valid_sso_access_token)
 
@@ -116,10 +237,12 @@ def get_free_tier_usage(mgmt_account_id, permission_set_name, sso_region):
 
     try:
         while True:
+            kwargs = {}
+            if filter_expression:
+                kwargs['filter'] = filter_expression
             if next_token:
-                response = client.get_free_tier_usage(nextToken=next_token)
-            else:
-                response = client.get_free_tier_usage()
+                kwargs['nextToken'] = next_token
+            response = client.get_free_tier_usage(**kwargs)
 
             if 'freeTierUsages' in response:
                 # Append the current response's data to free_tier_usage
@@ -137,25 +260,226 @@ def get_free_tier_usage(mgmt_account_id, permission_set_name, sso_region):
         logger.error(f"❌ An unexpected error occurred: {e}")
         return None
 
+# Function to forecast month-end usage for every free tier entry in one columnar pass
+def forecast_free_tier_usage(free_tier_usages, now=None):
+    now = now or datetime.now(timezone.utc)
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    elapsed_days = max((now - month_start).total_seconds() / 86400, 1 / 24)
+    days_in_month = (next_month_start - month_start).days
+
+    # Column vectors over all entries (linear burn rate since the first of the month)
+    actual = [float(usage.get('actualUsageAmount') or 0) for usage in free_tier_usages]
+    limit = [float(usage.get('limit') or 0) for usage in free_tier_usages]
+    burn_rate = [value / elapsed_days for value in actual]
+    projected = [rate * days_in_month for rate in burn_rate]
+    percent_used = [value / cap * 100 if cap else None for value, cap in zip(actual, limit)]
+    projected_percent = [value / cap * 100 if cap else None for value, cap in zip(projected, limit)]
+    days_to_exhaustion = [cap / rate if cap and rate else None for cap, rate in zip(limit, burn_rate)]
+
+    forecasts = []
+    for index, usage in enumerate(free_tier_usages):
+        exhaustion_date = None
+        if days_to_exhaustion[index] is not None:
+            exhaustion_at = month_start + timedelta(days=days_to_exhaustion[index])
+            if exhaustion_at < next_month_start:
+                exhaustion_date = exhaustion_at.date().isoformat()
+        forecasts.append({
+            'service': usage.get('service'),
+            'usageType': usage.get('usageType'),
+            'region': usage.get('region'),
+            'operation': usage.get('operation'),
+            'unit': usage.get('unit'),
+            'limit': usage.get('limit'),
+            'actualUsageAmount': usage.get('actualUsageAmount'),
+            'forecastedUsageAmount': usage.get('forecastedUsageAmount'),
+            'projectedUsageAmount': projected[index],
+            'burnRatePerDay': burn_rate[index],
+            'percentOfLimit': percent_used[index],
+            'projectedPercentOfLimit': projected_percent[index],
+            'projectedExhaustionDate': exhaustion_date,
+            'willExceedLimit': exhaustion_date is not None,
+        })
+
+    # Most at-risk entries first
+    forecasts.sort(key=lambda forecast: forecast['projectedPercentOfLimit'] or 0, reverse=True)
+    return {'GeneratedAt': now.isoformat(), 'Forecasts': forecasts}
+
+# Function to parse the optional /freetier filters (service, region, usage_type, min_percent)
+def parse_free_tier_filters(params):
+    filters = {}
+    for name in ['service', 'region', 'usage_type']:
+        if params.get(name):
+            values = sorted({value.strip() for value in params[name].split(',') if value.strip()})
+            if not values or not all(re.match(r'^[\w :./()+-]{1,256}$', value) for value in values):
+                raise ValueError(f"Invalid {name} parameter")
+            filters[name] = values
+    if params.get('min_percent'):
+        filters['min_percent'] = float(params['min_percent'])
+    return filters
+
+# Function to build the GetFreeTierUsage filter expression for the given filters
+def build_free_tier_filter(filters):
+    expressions = []
+    for name, dimension in [('service', 'SERVICE'), ('region', 'REGION'), ('usage_type', 'USAGE_TYPE')]:
+        if name in filters:
+            expressions.append({'Dimensions': {'Key': dimension, 'Values': filters[name], 'MatchOptions': ['EQUALS']}})
+    if 'min_percent' in filters:
+        expressions.append({'Dimensions': {'Key': 'USAGE_PERCENTAGE', 'Values': [str(filters['min_percent'])], 'MatchOptions': ['GREATER_THAN_OR_EQUAL']}})
+    return expressions[0] if len(expressions) == 1 else {'And': expressions}
+
+# Function to index the cached snapshot by service, region and usage type
+def build_free_tier_index(free_tier_usages):
+    index = {'service': {}, 'region': {}, 'usage_type': {}, 'entries': free_tier_usages}
+    for position, usage in enumerate(free_tier_usages):
+        for name, field in [('service', 'service'), ('region', 'region'), ('usage_type', 'usageType')]:
+            index[name].setdefault(usage.get(field), []).append(position)
+    return index
+
+# Function to answer filters from the index over the cached snapshot
+def query_free_tier_index(index, filters):
+    positions = None
+    for name in ['service', 'region', 'usage_type']:
+        if name in filters:
+            matched = set()
+            for value in filters[name]:
+                matched.update(index[name].get(value, []))
+            positions = matched if positions is None else positions & matched
+    if positions is None:
+        positions = range(len(index['entries']))
+
+    results = []
+    for position in sorted(positions):
+        usage = index['entries'][position]
+        if 'min_percent' in filters:
+            limit = float(usage.get('limit') or 0)
+            if not limit or float(usage.get('actualUsageAmount') or 0) / limit * 100 < filters['min_percent']:
+                continue
+        results.append(usage)
+    return results
+
+# Function to refresh the free tier snapshot and everything derived from it (returns the snapshot and its forecast)
+def refresh_free_tier_usage(current_time):
+    global free_tier_index
+    # Crawl, or reuse the snapshot another replica just took
+    usage, fetched_time = cache.fetch('freetier', current_time, cache_expiry, lambda: get_free_tier_usage(mgmt_account_id, permission_set_name, sso_region))
+    if not usage:
+        return None, None
+    # The snapshot already cached here (served while another replica refreshes): keep the index, forecast and history
+    forecast = cache.get('freetier_forecast') if cache.unchanged('freetier') else None
+    if forecast is not None:
+        cache_times['freetier'] = cache_times['freetier_forecast'] = fetched_time
+        return usage, forecast
+
+    cache.set('freetier', usage, cost=time.time() - current_time)
+    cache_times['freetier'] = fetched_time
+    # Index the snapshot so filtered requests are answered without another call
+    free_tier_index = build_free_tier_index(usage['freeTierUsages'])
+    # Precompute the ranked forecast so alerting can poll it cheaply
+    forecast = forecast_free_tier_usage(usage['freeTierUsages'])
+    cache.set('freetier_forecast', forecast)
+    cache_times['freetier_forecast'] = fetched_time
+    # Keep a local history of every new snapshot (once per snapshot, however often it is served)
+    if usage_history:
+        usage_history.append(usage['freeTierUsages'], current_time)
+    return usage, forecast
+
 @app.route('/freetier', methods=['GET'])
 def freetier():
     global cache, cache_times, mgmt_account_id, permission_set_name, sso_region
     current_time = time.time()
 
+    # Get the optional filters
+    try:
+        filters = parse_free_tier_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Check if the cached data is still valid (30 minutes)
     if 'freetier' in cache and (current_time - cache_times['freetier']) < cache_expiry:
+        if filters and free_tier_index:
+            logger.info("↩️ Answering the filters from the cached snapshot.")
+            return jsonify({'freeTierUsages': query_free_tier_index(free_tier_index, filters)})
         logger.info("↩️ Returning cached data to reduce API calls.")
-        return jsonify(cache['freetier'])
+        return cached_response(cache, 'freetier')
+
+    # With a cold cache, push the filters down into the GetFreeTierUsage filter expression
+    if filters:
+        cache_key = f"freetier?{json.dumps(filters, sort_keys=True)}"
+        if cache_key in cache and (current_time - cache_times[cache_key]) < cache_expiry:
+            logger.info("↩️ Returning cached data to reduce API calls.")
+            return cached_response(cache, cache_key)
+
+        usage, fetched_time = cache.fetch(cache_key, current_time, cache_expiry, lambda: get_free_tier_usage(mgmt_account_id, permission_set_name, sso_region, build_free_tier_filter(filters)))
+        if usage:
+            cache.set(cache_key, usage, cost=time.time() - current_time)
+            cache_times[cache_key] = fetched_time
+            return jsonify(usage)
+        return jsonify({"error": "Failed to retrieve free tier usage"}), 500
 
     # If not, get new data and update the cache
-    usage = get_free_tier_usage(mgmt_account_id, permission_set_name, sso_region)
+    usage, _ = refresh_free_tier_usage(current_time)
     if usage:
-        cache['freetier'] = usage
-        cache_times['freetier'] = current_time
         return jsonify(usage)
     else:
         return jsonify({"error": "Failed to retrieve free tier usage"}), 500
 
+@app.route('/freetier/forecast', methods=['GET'])
+def freetier_forecast():
+    global cache, cache_times
+    current_time = time.time()
+
+    # Get the optional parameters
+    try:
+        min_percent = float(request.args['min_percent']) if request.args.get('min_percent') else None
+        top = int(request.args['top']) if request.args.get('top') else None
+    except ValueError:
+        return jsonify({"error": "Invalid min_percent or top parameter"}), 400
+
+    # The forecast is computed on every refresh, only refresh when it has expired (30 minutes)
+    if 'freetier_forecast' in cache and (current_time - cache_times['freetier_forecast']) < cache_expiry:
+        if min_percent is None and top is None:
+            logger.info("↩️ Returning cached data to reduce API calls.")
+            return cached_response(cache, 'freetier_forecast')
+        forecast = cache['freetier_forecast']
+    else:
+        # Use the refreshed forecast directly, the cache may already have evicted it under its byte budget
+        _, forecast = refresh_free_tier_usage(current_time)
+        if not forecast:
+            return jsonify({"error": "Failed to retrieve free tier usage"}), 500
+    forecasts = forecast['Forecasts']
+    if min_percent is not None:
+        forecasts = [entry for entry in forecasts if (entry['projectedPercentOfLimit'] or 0) >= min_percent]
+    if top is not None:
+        forecasts = forecasts[:top]
+    return jsonify({'GeneratedAt': forecast['GeneratedAt'], 'Forecasts': forecasts})
+
+# Function to parse a timestamp given as epoch seconds or ISO 8601 (UTC if no offset)
+def parse_timestamp(value):
+    if value.isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if not parsed.tzinfo:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+@app.route('/freetier/history', methods=['GET'])
+def freetier_history():
+    if not usage_history:
+        return jsonify({"error": "The usage history store is disabled (start the exporter with --history-db)"}), 404
+
+    # Get the optional parameters (default: the last 30 days at full resolution)
+    current_time = int(time.time())
+    try:
+        start = parse_timestamp(request.args['start']) if request.args.get('start') else current_time - 30 * 86400
+        end = parse_timestamp(request.args['end']) if request.args.get('end') else current_time
+        step = int(request.args['step']) if request.args.get('step') else None
+    except ValueError:
+        return jsonify({"error": "Invalid start/end (epoch seconds or ISO 8601) or step (seconds) parameter"}), 400
+
+    history = usage_history.query(start, end, request.args.get('service'), request.args.get('usage_type'), request.args.get('region'), step)
+    return jsonify({'Start': start, 'End': end, 'History': history})
+
 @app.route('/freetier/cost-explorer', methods=['GET'])
 def cost_explorer():
     global cache, cache_times, mgmt_account_id, permission_set_name, sso_region
@@ -166,25 +490,53 @@ def cost_explorer():
     if not usage_types:
         return jsonify({"error": "Missing usage_types parameter"}), 400
 
-    # Get the optional parameter
+    # Get the optional parameters
     time_periods = request.args.get('time_periods')
+    group_by = request.args.get('group_by')
+    if group_by not in (None, 'usage_type'):
+        return jsonify({"error": "Invalid group_by parameter (expected usage_type)"}), 400
+
+    # Validate the parameters and canonicalize them, so equivalent requests share one cache entry
+    if not re.match(r'^[\w:.\-/]+( *, *[\w:.\-/]+)*$', usage_types):
+        return jsonify({"error": "Invalid usage_types parameter"}), 400
+    usage_types = ','.join(sorted({usage_type.strip() for usage_type in usage_types.split(',')}))
+    if usage_types.count(',') + 1 > ce_max_usage_types:
+        return jsonify({"error": f"Too many usage_types (at most {ce_max_usage_types})"}), 400
+    if time_periods:
+        try:
+            start_date, end_date = get_date_range(time_periods)
+        except (ValueError, IndexError):
+            return jsonify({"error": "Invalid time_periods parameter (expected YYYY-MM-DD,YYYY-MM-DD)"}), 400
+        if start_date >= end_date:
+            return jsonify({"error": "Invalid time_periods parameter (the start must be before the end)"}), 400
+        time_periods = f"{start_date.isoformat()},{end_date.isoformat()}"
+    cache_key = f"cost_explorer?usage_types={usage_types}&time_periods={time_periods or ''}&group_by={group_by or ''}"
 
     # Check if the cached data is still valid (30 minutes)
-    if 'cost_explorer' in cache and (current_time - cache_times['cost_explorer']) < cache_expiry:
+    if cache_key in cache and (current_time - cache_times[cache_key]) < cache_expiry:
         logger.info("↩️  Returning cached data to reduce API calls.")
-        return jsonify(cache['cost_explorer'])
+        return cached_response(cache, cache_key)
 
-    # If not, get new data and update the cache
-    cost_data = get_cost_and_usage(usage_types, time_periods, mgmt_account_id, permission_set_name, sso_region, valid_sso_access_token)
+    # If not, get new data (only the days not yet final are queried) and update the cache
+    cost_data, fetched_time = cache.fetch(cache_key, current_time, cache_expiry, lambda: get_cost_and_usage(usage_types, time_periods, mgmt_account_id, permission_set_name, sso_region, valid_sso_access_token, group_by == 'usage_type'))
     if cost_data:
-        cache['cost_explorer'] = cost_data
-        cache_times['cost_explorer'] = current_time
+        cache.set(cache_key, cost_data, cost=time.time() - current_time)
+        cache_times[cache_key] = fetched_time
         return jsonify(cost_data)
     else:
         return jsonify({"error": "Failed to retrieve cost explorer usage"}), 500
 
+# Function to drop the bookkeeping of an evicted cache entry
+def release_cache_key(cache_key):
+    cache_times.pop(cache_key, None)
+
+@app.route('/cache/usage', methods=['GET'])
+def cache_usage():
+    return jsonify(cache.stats())
+
 def main():
-    global mgmt_account_id, permission_set_name, sso_region, cache_expiry, valid_sso_access_token
+    global mgmt_account_id, permission_set_name, sso_region, cache_expiry, valid_sso_access_token, cache
+    global ce_restatement_days, ce_store_retention_days, ce_max_usage_types, usage_history
 
     parser = argparse.ArgumentParser(description="Retrieve free tier & cost explorer usage details from the management account.")
     parser.add_argument('--mgmt-account-id', type=str, required=True, help="Management account ID.")
@@ -193,6 +545,19 @@ def main():
     parser.add_argument('--port', type=int, default=4921, help="Port to run the Flask app on.")
     parser.add_argument('--cache-expiry', type=int, default=default_cache_expiry, help="Cache expiry time in seconds.")
     parser.add_argument('--access-token', type=str, default=valid_sso_access_token, help="Valid access token.")
+    parser.add_argument('--ce-restatement-days', type=int, default=default_ce_restatement_days, help="Trailing days of Cost Explorer data refetched once older than the cache expiry (older days are treated as final).")
+    parser.add_argument('--ce-store-retention-days', type=int, default=default_ce_store_retention_days, help="Days of daily Cost Explorer usage kept in memory.")
+    parser.add_argument('--ce-max-usage-types', type=int, default=default_ce_max_usage_types, help="Distinct usage types kept in the daily Cost Explorer usage store (least recently requested are dropped first).")
+    parser.add_argument('--history-db', type=str, default=None, help="SQLite file to record every refreshed free tier snapshot in (enables /freetier/history).")
+    parser.add_argument('--history-retention-days', type=int, default=default_history_retention_days, help="Days of free tier usage history to keep.")
+    parser.add_argument('--history-raw-days', type=int, default=default_history_raw_days, help="Days of free tier usage history kept at full resolution before downsampling to daily.")
+    parser.add_argument('--cache-compression', type=str, choices=COMPRESSION_CHOICES, default='none', help="Keep cache entries as compressed JSON ('zstd' needs the zstandard module).")
+    parser.add_argument('--cache-hot-entries', type=int, default=default_hot_entries, help="Number of decoded cache entries kept in memory when compression is enabled.")
+    parser.add_argument('--cache-max-bytes', type=int, default=default_cache_max_bytes, help="Memory budget for the cache in bytes (0 = unbounded).")
+    parser.add_argument('--cache-eviction', type=str, choices=EVICTION_CHOICES, default='lru', help="Eviction policy used when the cache exceeds its memory budget.")
+    parser.add_argument('--shared-cache', type=str, default=None, help="Cache shared by all replicas: redis://host:port/db or a shared directory (only the lease holder crawls AWS).")
+    parser.add_argument('--shared-cache-lease', type=int, default=default_shared_cache_lease, help="Seconds a replica holds the lease of a key while it refreshes it.")
+    parser.add_argument('--shared-cache-wait', type=int, default=default_shared_cache_wait, help="Seconds a replica waits for the lease holder's first result before crawling itself.")
     args = parser.parse_args()
 
     mgmt_account_id = args.mgmt_account_id
@@ -200,6 +565,18 @@ def main():
     sso_region = args.sso_region
     cache_expiry = args.cache_expiry
     valid_sso_access_token = args.access_token
+    ce_restatement_days = args.ce_restatement_days
+    ce_store_retention_days = args.ce_store_retention_days
+    ce_max_usage_types = args.ce_max_usage_types
+
+    # Record refreshed snapshots locally so trend panels don't need AWS
+    if args.history_db:
+        usage_history = UsageHistoryStore(args.history_db, args.history_retention_days, args.history_raw_days)
+
+    # Keep the cache bounded, optionally compressed (entries are decoded only when a request needs them)
+    # and shared with the other replicas (one crawl per key across all of them)
+    shared_cache = create_shared_cache(args.shared_cache, 'freetier-usage', args.shared_cache_lease, args.shared_cache_wait, app.json.dumps)
+    cache = CacheStore(args.cache_compression, args.cache_hot_entries, app.json.dumps, args.cache_max_bytes, args.cache_eviction, release_cache_key, shared_cache)
 
     app.run(host='0.0.0.0', port=args.port)
 
@@ -10,6 +10,12 @@ Metadata:
 Description:
 This script retrieves and exports information about AWS Identity Center.
 It includes endpoints for Identity Center structure, and PermissionSets.
+Each refresh is diffed against the previous crawl, and `/identity-center/changes?since=<epoch>.<version>`
+returns only the added, removed and modified nodes (users, group memberships, assignments).
+`?expand=groups,assignments,permission_sets` selects the sub-collections to include; each
+level is cached separately, so shallow views never trigger the nested crawl.
+An effective-access matrix (who reaches which account with which permission set, directly or
+through a group) is built once per refresh and served by `/identity-center/access/...`.
 
 Usage:
     python identity_center_exporter.py --mgmt-account-id <management_account_id> --permission-set-name <permission_set_name> --sso-region <sso_region> [--port <port>] [--cache-expiry <cache_expiry>] [--cache-expiry <cache_expiry>] [--access-token <valid_sso_access_token>]
@@ -22,9 +28,14 @@ import argparse
 import os
 import time
 import logging
-from flask import Flask, jsonify
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, jsonify, request
 #from aws_utils.aws_utils import create_session # For Directory Structure
-from aws_exporters.aws_utils import create_session
+from aws_exporters.aws_utils import (
+    create_session, ChangeLog, default_change_log_versions, CacheStore, cached_response,
+    create_shared_cache, default_shared_cache_lease, default_shared_cache_wait, COMPRESSION_CHOICES,
+    EVICTION_CHOICES, default_hot_entries, default_cache_max_bytes,
+)
 
 ### INIT CONFIGURATIONS ----------------------------------------
 # Configure logging
@@ -32,16 +43,24 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 ### GLOBAL VARIABLES -------------------------------------------
-cache = {}
+cache = CacheStore()
 cache_times = {}
 default_cache_expiry = 3600  # 60 minutes
 valid_sso_access_token = None
+identity_center_changes = ChangeLog()
+# Sub-collections of /identity-center, each crawled and cached as its own level
+EXPAND_LEVELS = ['groups', 'assignments', 'permission_sets']
+# Concurrent API calls used to fetch permission set details
+default_permission_set_workers = 8
+permission_set_workers = default_permission_set_workers
+# Effective-access matrix (by account, by permission set, by user)
+access_index = {}
 
 ###-------------------------------------------------------------
 
 app = Flask(__name__)
 
-def get_users(identitystore_client, sso_admin_client, identity_store_id, instance_arn):
+def get_users(identitystore_client, identity_store_id):
     paginator = identitystore_client.get_paginator('list_users')
     response_iterator = paginator.paginate(IdentityStoreId=identity_store_id)
     
@@ -49,25 +68,27 @@ def get_users(identitystore_client, sso_admin_client, identity_store_id, instanc
     for response in response_iterator:
         for user in response['Users']:
             user_details = identitystore_client.describe_user(IdentityStoreId=identity_store_id, UserId=user['UserId'])
-            user_details['JoinedGroup'] = get_groups_for_user(identitystore_client, identity_store_id, user['UserId'])
-            user_details['AccountAssignments'] = get_account_assignments(sso_admin_client, instance_arn, user['UserId'])
             user_details.pop('ResponseMetadata', None)
             users.append(user_details)
     if not users:
         users = [{'None': None}]
     return users
 
-def get_groups_for_user(identitystore_client, identity_store_id, user_id):
+def get_groups_for_user(identitystore_client, identity_store_id, user_id, group_details_cache=None):
     paginator = identitystore_client.get_paginator('list_group_memberships_for_member')
     response_iterator = paginator.paginate(IdentityStoreId=identity_store_id, MemberId={'UserId': user_id})
+    group_details_cache = {} if group_details_cache is None else group_details_cache
     
     groups = []
     for response in response_iterator:
         for group_membership in response['GroupMemberships']:
             group_id = group_membership['GroupId']
-            group_details = identitystore_client.describe_group(IdentityStoreId=identity_store_id, GroupId=group_id)
-            group_details.pop('ResponseMetadata', None)
-            groups.append(group_details)
+            # Groups are shared by many users, describe each one once per crawl
+            if group_id not in group_details_cache:
+                group_details = identitystore_client.describe_group(IdentityStoreId=identity_store_id, GroupId=group_id)
+                group_details.pop('ResponseMetadata', None)
+                group_details_cache[group_id] = group_details
+            groups.append(group_details_cache[group_id])
     if not groups:
         groups = [{'None': None}]
     return groups
@@ -85,56 +106,91 @@ def get_account_assignments(sso_admin_client, instance_arn, user_id):
     assignments = []
     for response in response_iterator:
         for assignment in response['AccountAssignments']:
-            permission_set_details = get_permission_set_details(sso_admin_client, instance_arn, assignment['PermissionSetArn'])
-            assignment['PermissionSet'] = permission_set_details
             assignments.append(assignment)
     if not assignments:
         assignments = [{'None': None}]
     return assignments
 
-def get_all_permission_set_details(sso_admin_client, instance_arn, permission_set_arn):
-    response = sso_admin_client.describe_permission_set(InstanceArn=instance_arn, PermissionSetArn=permission_set_arn)
-    permission_set = response['PermissionSet']
-    permission_set.pop('ResponseMetadata', None)
-
-    # Attach managed policies
-    managed_policies = sso_admin_client.list_managed_policies_in_permission_set(InstanceArn=instance_arn, PermissionSetArn=permission_set_arn)['AttachedManagedPolicies']
-    if not managed_policies:
-        permission_set['AttachedManagedPolicies'] = [{'None': None}]
-    else:
-        permission_set['AttachedManagedPolicies'] = managed_policies
-
-    # Attach customer-managed policies
-    customer_managed_policies = sso_admin_client.list_customer_managed_policy_references_in_permission_set(InstanceArn=instance_arn, PermissionSetArn=permission_set_arn)['CustomerManagedPolicyReferences']
-    if not customer_managed_policies:
-        permission_set['CustomerManagedPolicyReferences'] = [{'None': None}]
-    else:
-        permission_set['CustomerManagedPolicyReferences'] = customer_managed_policies
-
-    # Get inline policy
+# Functions to get the sub-resources of a permission set (fully paginated)
+def get_managed_policies_in_permission_set(sso_admin_client, instance_arn, permission_set_arn):
+    paginator = sso_admin_client.get_paginator('list_managed_policies_in_permission_set')
+    managed_policies = []
+    for response in paginator.paginate(InstanceArn=instance_arn, PermissionSetArn=permission_set_arn):
+        managed_policies.extend(response['AttachedManagedPolicies'])
+    return managed_policies
+
+def get_customer_managed_policy_references(sso_admin_client, instance_arn, permission_set_arn):
+    paginator = sso_admin_client.get_paginator('list_customer_managed_policy_references_in_permission_set')
+    customer_managed_policies = []
+    for response in paginator.paginate(InstanceArn=instance_arn, PermissionSetArn=permission_set_arn):
+        customer_managed_policies.extend(response['CustomerManagedPolicyReferences'])
+    return customer_managed_policies
+
+def get_inline_policy(sso_admin_client, instance_arn, permission_set_arn):
     try:
-        inline_policy = sso_admin_client.get_inline_policy_for_permission_set(InstanceArn=instance_arn, PermissionSetArn=permission_set_arn)['InlinePolicy']
+        return sso_admin_client.get_inline_policy_for_permission_set(InstanceArn=instance_arn, PermissionSetArn=permission_set_arn)['InlinePolicy']
     except sso_admin_client.exceptions.ResourceNotFoundException:
-        inline_policy = ''
-    if not inline_policy:
-        permission_set['InlinePolicy'] = [{'None': None}]
-    else:
-        permission_set['InlinePolicy'] = inline_policy
+        return ''
 
-    # Get permissions boundary
+def get_permissions_boundary(sso_admin_client, instance_arn, permission_set_arn):
     try:
-        permissions_boundary = sso_admin_client.get_permissions_boundary_for_permission_set(InstanceArn=instance_arn, PermissionSetArn=permission_set_arn)['PermissionsBoundary']
+        return sso_admin_client.get_permissions_boundary_for_permission_set(InstanceArn=instance_arn, PermissionSetArn=permission_set_arn)['PermissionsBoundary']
     except sso_admin_client.exceptions.ResourceNotFoundException:
-        permissions_boundary = ''
-    if not permissions_boundary:
-        permission_set['PermissionsBoundary'] = [{'None': None}]
-    else:
-        permission_set['PermissionsBoundary'] = permissions_boundary
+        return ''
+
+# Permission set fields and the function fetching each of them
+PERMISSION_SET_SUB_RESOURCES = {
+    'AttachedManagedPolicies': get_managed_policies_in_permission_set,
+    'CustomerManagedPolicyReferences': get_customer_managed_policy_references,
+    'InlinePolicy': get_inline_policy,
+    'PermissionsBoundary': get_permissions_boundary,
+}
+
+# Function to get the details of many permission sets, fetching every sub-resource concurrently
+def get_all_permission_set_details(sso_admin_client, targets):
+    """
+    Describes permission sets together with their policies.
+
+    Parameters:
+    - sso_admin_client: Boto3 SSO Admin client (clients are thread-safe).
+    - targets (list): [(instance_arn, permission_set_arn)].
+
+    Returns:
+    - dict: {permission_set_arn: details}, in the order of `targets`.
+    """
+    futures = {}
+    with ThreadPoolExecutor(max_workers=permission_set_workers) as executor:
+        for instance_arn, permission_set_arn in targets:
+            futures[permission_set_arn] = (
+                executor.submit(get_permission_set_details, sso_admin_client, instance_arn, permission_set_arn),
+                {field: executor.submit(fetch, sso_admin_client, instance_arn, permission_set_arn) for field, fetch in PERMISSION_SET_SUB_RESOURCES.items()},
+            )
+
+    permission_sets = {}
+    for permission_set_arn, (describe_future, sub_resource_futures) in futures.items():
+        permission_set = describe_future.result()
+        for field, future in sub_resource_futures.items():
+            permission_set[field] = future.result() or [{'None': None}]
+        permission_sets[permission_set_arn] = permission_set
+    return permission_sets
+
+# Function to get every permission set of every instance ({permission_set_arn: details})
+def get_permission_set_store(mgmt_account_id, permission_set_name, sso_region):
+    # Create a Boto3 client for the SSO Admin service
+    sso_admin_client = create_session(mgmt_account_id, permission_set_name, sso_region, "sso-admin", valid_sso_access_token)
 
-    return permission_set
+    if not sso_admin_client:
+        return None
 
-# Main function to get identity center information
-def get_identity_center_structure(mgmt_account_id, permission_set_name, sso_region):
+    targets = []
+    for instance in sso_admin_client.list_instances()['Instances']:
+        paginator = sso_admin_client.get_paginator('list_permission_sets')
+        for response in paginator.paginate(InstanceArn=instance['InstanceArn']):
+            targets.extend((instance['InstanceArn'], permission_set_arn) for permission_set_arn in response['PermissionSets'])
+    return get_all_permission_set_details(sso_admin_client, targets)
+
+# Function to get the users of every instance (the shallow level, no nested crawl)
+def get_identity_center_users(mgmt_account_id, permission_set_name, sso_region):
     # Create Boto3 clients for the SSO Admin and Identity Store services
     sso_admin_client = create_session(mgmt_account_id, permission_set_name, sso_region, "sso-admin", valid_sso_access_token)
     identitystore_client = create_session(mgmt_account_id, permission_set_name, sso_region, "identitystore", valid_sso_access_token)
@@ -145,73 +201,317 @@ def get_identity_center_structure(mgmt_account_id, permission_set_name, sso_regi
     instances = sso_admin_client.list_instances()['Instances']
     identity_center_structure = []
     for instance in instances:
-        identity_store_id = instance['IdentityStoreId']
-        instance['Users'] = get_users(identitystore_client, sso_admin_client, identity_store_id, instance['InstanceArn'])
-        if not instance['Users']:
-            instance['Users'] = [{'None': None}]
+        instance['Users'] = get_users(identitystore_client, instance['IdentityStoreId'])
         identity_center_structure.append(instance)
     
     return {'identity_center': identity_center_structure}
 
-def get_all_permission_sets(mgmt_account_id, permission_set_name, sso_region):
-    # Create Boto3 clients for the SSO Admin service
+# Function to get the group memberships of every user ({user_id: groups})
+def get_identity_center_groups(users_level, mgmt_account_id, permission_set_name, sso_region):
+    # Create a Boto3 client for the Identity Store service
+    identitystore_client = create_session(mgmt_account_id, permission_set_name, sso_region, "identitystore", valid_sso_access_token)
+
+    if not identitystore_client:
+        return None
+
+    groups = {}
+    for instance in users_level['identity_center']:
+        group_details_cache = {}
+        for user in instance['Users']:
+            if 'UserId' in user:
+                groups[user['UserId']] = get_groups_for_user(identitystore_client, instance['IdentityStoreId'], user['UserId'], group_details_cache)
+    return groups
+
+# Function to get the account assignments of every user ({user_id: assignments})
+def get_identity_center_assignments(users_level, mgmt_account_id, permission_set_name, sso_region):
+    # Create a Boto3 client for the SSO Admin service
     sso_admin_client = create_session(mgmt_account_id, permission_set_name, sso_region, "sso-admin", valid_sso_access_token)
 
     if not sso_admin_client:
         return None
 
-    instance_arn = sso_admin_client.list_instances()['Instances'][0]['InstanceArn']
-    paginator = sso_admin_client.get_paginator('list_permission_sets')
-    response_iterator = paginator.paginate(InstanceArn=instance_arn)
-    
-    permission_sets = []
-    for response in response_iterator:
-        for permission_set_arn in response['PermissionSets']:
-            permission_set_details = get_all_permission_set_details(sso_admin_client, instance_arn, permission_set_arn)
-            permission_sets.append(permission_set_details)
+    assignments = {}
+    for instance in users_level['identity_center']:
+        for user in instance['Users']:
+            if 'UserId' in user:
+                assignments[user['UserId']] = get_account_assignments(sso_admin_client, instance['InstanceArn'], user['UserId'])
+    return assignments
+
+# Function to get one crawl level from the cache, fetching it only when it has expired
+def get_identity_center_level(level, current_time, fetch, base_time=0):
+    key = f"identity_center_{level}"
+    # Nested levels are only valid for the users level they were crawled from (base_time)
+    if key in cache and (current_time - cache_times[key]) < cache_expiry and cache_times[key] >= base_time:
+        return cache[key], cache_times[key]
+
+    logger.info(f"🔍 Retrieving identity center {level}...")
+    # Crawl, or reuse the level another replica just crawled
+    value, fetched_time = cache.fetch(key, current_time, cache_expiry, fetch, base_time)
+    if value is None:
+        return None, None
+    cache.set(key, value, cost=time.time() - current_time)
+    cache_times[key] = fetched_time
+    return value, fetched_time
+
+# Function to get the shared permission set store, fetched at most once per refresh
+def get_permission_sets_level(current_time, required_arns=(), required_since=0):
+    base_time = 0
+    permission_sets = cache.get('identity_center_permission_sets')
+    # Refetch early (once per assignments crawl) when an assignment references an unknown permission set
+    if permission_sets is not None and not set(required_arns) <= set(permission_sets):
+        base_time = required_since
+    return get_identity_center_level('permission_sets', current_time, lambda: get_permission_set_store(mgmt_account_id, permission_set_name, sso_region), base_time)
+
+# Function to parse the expand parameter (default: every level)
+def parse_expand(value):
+    if value is None:
+        return list(EXPAND_LEVELS)
+    expand = {level.strip() for level in value.split(',') if level.strip() and level.strip() != 'none'}
+    unknown = expand - set(EXPAND_LEVELS)
+    if unknown:
+        raise ValueError(f"Invalid expand value(s): {sorted(unknown)}. Must be any of {EXPAND_LEVELS}")
+    # Permission set details hang off the assignments
+    if 'permission_sets' in expand:
+        expand.add('assignments')
+    return [level for level in EXPAND_LEVELS if level in expand]
+
+# Main function to get identity center information
+def get_identity_center_structure(expand, current_time):
+    """
+    Composes the identity center structure from separately cached crawl levels.
+
+    Parameters:
+    - expand (list): Sub-collections to include ('groups', 'assignments', 'permission_sets').
+    - current_time (float): Request time.
+
+    Returns:
+    - tuple: (structure, fetched_time of the oldest level used), or (None, None) on failure.
+    """
+    users_level, fetched_time = get_identity_center_level('users', current_time, lambda: get_identity_center_users(mgmt_account_id, permission_set_name, sso_region))
+    if users_level is None:
+        return None, None
+    fetched_times = [fetched_time]
+    users_time = fetched_time
+
+    groups_level = assignments_level = permission_sets_level = None
+    if 'groups' in expand:
+        groups_level, fetched_time = get_identity_center_level('groups', current_time, lambda: get_identity_center_groups(users_level, mgmt_account_id, permission_set_name, sso_region), users_time)
+        fetched_times.append(fetched_time)
+    if 'assignments' in expand:
+        assignments_level, assignments_time = get_identity_center_level('assignments', current_time, lambda: get_identity_center_assignments(users_level, mgmt_account_id, permission_set_name, sso_region), users_time)
+        fetched_times.append(assignments_time)
+    if 'permission_sets' in expand and assignments_level is not None:
+        # Shared with /identity-center/permsets, so each permission set is fetched once per refresh
+        referenced_arns = {assignment['PermissionSetArn'] for assignments in assignments_level.values() for assignment in assignments if 'PermissionSetArn' in assignment}
+        permission_sets_level, fetched_time = get_permission_sets_level(current_time, referenced_arns, assignments_time)
+        fetched_times.append(fetched_time)
+    if None in fetched_times:
+        return None, None
+
+    # Compose without touching the cached levels
+    identity_center_structure = []
+    for instance in users_level['identity_center']:
+        users = []
+        for user in instance['Users']:
+            if 'UserId' not in user:
+                users.append(user)
+                continue
+            user = dict(user)
+            if groups_level is not None:
+                user['JoinedGroup'] = groups_level.get(user['UserId'], [{'None': None}])
+            if assignments_level is not None:
+                assignments = []
+                for assignment in assignments_level.get(user['UserId'], [{'None': None}]):
+                    if permission_sets_level is not None and 'PermissionSetArn' in assignment:
+                        assignment = dict(assignment, PermissionSet=permission_sets_level.get(assignment['PermissionSetArn']))
+                    assignments.append(assignment)
+                user['AccountAssignments'] = assignments
+            users.append(user)
+        identity_center_structure.append(dict(instance, Users=users))
     
-    return {'PermissionSets': permission_sets}
+    return {'identity_center': identity_center_structure}, min(fetched_times)
+
+# Function to flatten the identity center structure into {node_id: node} for diffing
+def flatten_identity_center_structure(identity_center_structure):
+    nodes = {}
+    for instance in identity_center_structure['identity_center']:
+        instance_node_id = f"instance:{instance['InstanceArn']}"
+        nodes[instance_node_id] = dict({key: value for key, value in instance.items() if key != 'Users'}, NodeId=instance_node_id)
+        for user in instance.get('Users', []):
+            if 'UserId' not in user:
+                continue
+            user_id = user['UserId']
+            user_node_id = f"user:{user_id}"
+            nodes[user_node_id] = dict({key: value for key, value in user.items() if key not in ('JoinedGroup', 'AccountAssignments')}, NodeId=user_node_id)
+            for group in user.get('JoinedGroup', []):
+                if 'GroupId' in group:
+                    membership_node_id = f"membership:{user_id}:{group['GroupId']}"
+                    nodes[membership_node_id] = dict(group, NodeId=membership_node_id, UserId=user_id)
+            for assignment in user.get('AccountAssignments', []):
+                if 'AccountId' in assignment:
+                    assignment_node_id = f"assignment:{user_id}:{assignment['AccountId']}:{assignment['PermissionSetArn']}:{assignment.get('PrincipalId', user_id)}"
+                    nodes[assignment_node_id] = dict(assignment, NodeId=assignment_node_id, UserId=user_id)
+    return nodes
+
+# Function to build the effective-access matrix (who reaches which account with which permission set, and how)
+def build_access_index(identity_center_structure):
+    index = {'by_account': {}, 'by_permission_set': {}, 'by_user': {}, 'permission_set_arns': {}, 'user_ids': {}}
+    for instance in identity_center_structure['identity_center']:
+        for user in instance.get('Users', []):
+            if 'UserId' not in user:
+                continue
+            index['user_ids'][user.get('UserName')] = user['UserId']
+            group_names = {group['GroupId']: group.get('DisplayName') for group in user.get('JoinedGroup', []) if 'GroupId' in group}
+            entries = index['by_user'].setdefault(user['UserId'], [])
+            for assignment in user.get('AccountAssignments', []):
+                if 'AccountId' not in assignment:
+                    continue
+                permission_set = assignment.get('PermissionSet', {})
+                # Assignments for a user include those inherited through its groups (PrincipalType GROUP)
+                via_group = assignment.get('PrincipalType') == 'GROUP'
+                entry = {
+                    'UserId': user['UserId'],
+                    'UserName': user.get('UserName'),
+                    'AccountId': assignment['AccountId'],
+                    'PermissionSetArn': assignment['PermissionSetArn'],
+                    'PermissionSetName': permission_set.get('Name'),
+                    'Via': 'GROUP' if via_group else 'DIRECT',
+                    'GroupId': assignment.get('PrincipalId') if via_group else None,
+                    'GroupName': group_names.get(assignment.get('PrincipalId')) if via_group else None,
+                }
+                entries.append(entry)
+                index['by_account'].setdefault(assignment['AccountId'], []).append(entry)
+                index['by_permission_set'].setdefault(assignment['PermissionSetArn'], []).append(entry)
+                if permission_set.get('Name'):
+                    index['permission_set_arns'][permission_set['Name']] = assignment['PermissionSetArn']
+    return index
+
+# Function to refresh the full identity center structure and everything derived from it
+def refresh_identity_center_structure(current_time):
+    identity_center_structure, fetched_time = get_identity_center_structure(EXPAND_LEVELS, current_time)
+    if not identity_center_structure:
+        return None
+
+    cache.set('identity_center', identity_center_structure, cost=time.time() - current_time)
+    cache_times['identity_center'] = fetched_time
+    # Inverted index over users, groups, accounts and permission sets, built once per refresh
+    access_index.update(build_access_index(identity_center_structure))
+    access_index['time'] = fetched_time
+    # Diff against the previous crawl once, here, instead of in every consumer. Nodes go through the
+    # response serializer first: a fresh crawl holds datetimes, while compressed or shared hits hold
+    # their JSON strings, and the two would otherwise compare as modified
+    version = identity_center_changes.record(json.loads(app.json.dumps(flatten_identity_center_structure(identity_center_structure))))
+    logger.info(f"🔔 Identity center structure is at version {version}.")
+    return identity_center_structure
 
 @app.route('/identity-center', methods=['GET'])
 def identity_center():
     global cache, cache_times, mgmt_account_id, permission_set_name, sso_region
     current_time = time.time()
 
+    # Get the optional parameter (which sub-collections to expand, default: all)
+    try:
+        expand = parse_expand(request.args.get('expand'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    cache_key = 'identity_center' if expand == EXPAND_LEVELS else f"identity_center?expand={','.join(expand)}"
+
     # Check if the cached data is still valid (60 minutes)
-    if 'identity_center' in cache and (current_time - cache_times['identity_center']) < cache_expiry:
+    if cache_key in cache and (current_time - cache_times[cache_key]) < cache_expiry:
         logger.info("↩️  Returning cached data to reduce API calls.")
-        return jsonify(cache['identity_center'])
+        return cached_response(cache, cache_key)
 
-    # If not, get new data and update the cache
-    identity_center_structure = get_identity_center_structure(mgmt_account_id, permission_set_name, sso_region)
+    # If not, get new data (only the expired levels are crawled again) and update the cache
+    if cache_key == 'identity_center':
+        identity_center_structure = refresh_identity_center_structure(current_time)
+    else:
+        identity_center_structure, fetched_time = get_identity_center_structure(expand, current_time)
+        if identity_center_structure:
+            cache.set(cache_key, identity_center_structure, cost=time.time() - current_time)
+            cache_times[cache_key] = fetched_time
     if identity_center_structure:
-        cache['identity_center'] = identity_center_structure
-        cache_times['identity_center'] = current_time
         return jsonify(identity_center_structure)
     else:
         return jsonify({"error": "Failed to retrieve identity center structure"}), 500
 
+@app.route('/identity-center/changes', methods=['GET'])
+def identity_center_changes_since():
+    current_time = time.time()
+
+    # Get the optional parameter (the Version token of a previous response, `<epoch>.<version>`)
+    since = request.args.get('since') or None
+    try:
+        ChangeLog.parse_token(since)
+    except ValueError:
+        return jsonify({"error": "Invalid since parameter (expected the Version token of a previous response)"}), 400
+
+    # Refresh (and diff) when the cached snapshot has expired (60 minutes)
+    if not ('identity_center' in cache and (current_time - cache_times['identity_center']) < cache_expiry):
+        if not refresh_identity_center_structure(current_time):
+            return jsonify({"error": "Failed to retrieve identity center structure"}), 500
+
+    return jsonify(identity_center_changes.changes_since(since))
+
+# Function to make sure the access index is built from an unexpired crawl
+def ensure_access_index(current_time):
+    if 'time' not in access_index or (current_time - access_index['time']) >= cache_expiry:
+        return refresh_identity_center_structure(current_time) is not None
+    return True
+
+@app.route('/identity-center/access/account/<account_id>', methods=['GET'])
+def access_by_account(account_id):
+    if not ensure_access_index(time.time()):
+        return jsonify({"error": "Failed to retrieve identity center structure"}), 500
+
+    entries = access_index['by_account'].get(account_id, [])
+    # Get the optional parameter (permission set name or ARN)
+    permission_set = request.args.get('permission_set')
+    if permission_set:
+        permission_set_arn = access_index['permission_set_arns'].get(permission_set, permission_set)
+        entries = [entry for entry in entries if entry['PermissionSetArn'] == permission_set_arn]
+    return jsonify({'AccountId': account_id, 'Access': entries})
+
+@app.route('/identity-center/access/permission-set/<path:permission_set>', methods=['GET'])
+def access_by_permission_set(permission_set):
+    if not ensure_access_index(time.time()):
+        return jsonify({"error": "Failed to retrieve identity center structure"}), 500
+
+    permission_set_arn = access_index['permission_set_arns'].get(permission_set, permission_set)
+    return jsonify({'PermissionSetArn': permission_set_arn, 'Access': access_index['by_permission_set'].get(permission_set_arn, [])})
+
+@app.route('/identity-center/access/user/<user>', methods=['GET'])
+def access_by_user(user):
+    if not ensure_access_index(time.time()):
+        return jsonify({"error": "Failed to retrieve identity center structure"}), 500
+
+    # Accept either the user name or the user ID
+    user_id = access_index['user_ids'].get(user, user)
+    if user_id not in access_index['by_user']:
+        return jsonify({"error": f"User {user} not found"}), 404
+    return jsonify({'UserId': user_id, 'Access': access_index['by_user'][user_id]})
+
 @app.route('/identity-center/permsets', methods=['GET'])
 def permission_sets():
     global cache, cache_times, mgmt_account_id, permission_set_name, sso_region
     current_time = time.time()
 
-    # Check if the cached data is still valid (60 minutes)
-    if 'permission_sets' in cache and (current_time - cache_times['permission_sets']) < cache_expiry:
-        logger.info("↩️  Returning cached data to reduce API calls.")
-        return jsonify(cache['permission_sets'])
-
-    # If not, get new data and update the cache
-    permission_sets = get_all_permission_sets(mgmt_account_id, permission_set_name, sso_region)
+    # Read from the permission set store shared with /identity-center (refreshed every 60 minutes)
+    permission_sets, _ = get_permission_sets_level(current_time)
     if permission_sets:
-        cache['permission_sets'] = permission_sets
-        cache_times['permission_sets'] = current_time
-        return jsonify(permission_sets)
+        return jsonify({'PermissionSets': list(permission_sets.values())})
     else:
         return jsonify({"error": "Failed to retrieve permission sets"}), 500
 
+# Function to drop the bookkeeping of an evicted cache entry
+def release_cache_key(cache_key):
+    cache_times.pop(cache_key, None)
+
+@app.route('/cache/usage', methods=['GET'])
+def cache_usage():
+    return jsonify(cache.stats())
+
 def main():
-    global mgmt_account_id, permission_set_name, sso_region, cache_expiry, valid_sso_access_token
+    global mgmt_account_id, permission_set_name, sso_region, cache_expiry, valid_sso_access_token, cache, identity_center_changes, permission_set_workers
 
     parser = argparse.ArgumentParser(description="Retrieve AWS Identity Center structure and users.")
     parser.add_argument('--mgmt-account-id', type=str, required=True, help="Management account ID.")
@@ -220,6 +520,15 @@ def main():
     parser.add_argument('--port', type=int, default=11121, help="Port to run the Flask app on.")
     parser.add_argument('--cache-expiry', type=int, default=default_cache_expiry, help="Cache expiry time in seconds.")
     parser.add_argument('--access-token', type=str, default=valid_sso_access_token, help="Valid access token.")
+    parser.add_argument('--permission-set-workers', type=int, default=default_permission_set_workers, help="Number of concurrent API calls used to fetch permission set details.")
+    parser.add_argument('--change-log-versions', type=int, default=default_change_log_versions, help="Number of snapshot diffs kept for /identity-center/changes.")
+    parser.add_argument('--cache-compression', type=str, choices=COMPRESSION_CHOICES, default='none', help="Keep cache entries as compressed JSON ('zstd' needs the zstandard module).")
+    parser.add_argument('--cache-hot-entries', type=int, default=default_hot_entries, help="Number of decoded cache entries kept in memory when compression is enabled.")
+    parser.add_argument('--cache-max-bytes', type=int, default=default_cache_max_bytes, help="Memory budget for the cache in bytes (0 = unbounded).")
+    parser.add_argument('--cache-eviction', type=str, choices=EVICTION_CHOICES, default='lru', help="Eviction policy used when the cache exceeds its memory budget.")
+    parser.add_argument('--shared-cache', type=str, default=None, help="Cache shared by all replicas: redis://host:port/db or a shared directory (only the lease holder crawls AWS).")
+    parser.add_argument('--shared-cache-lease', type=int, default=default_shared_cache_lease, help="Seconds a replica holds the lease of a key while it refreshes it.")
+    parser.add_argument('--shared-cache-wait', type=int, default=default_shared_cache_wait, help="Seconds a replica waits for the lease holder's first result before crawling itself.")
     args = parser.parse_args()
 
     mgmt_account_id = args.mgmt_account_id
@@ -227,6 +536,12 @@ def main():
     sso_region = args.sso_region
     cache_expiry = args.cache_expiry
     valid_sso_access_token = args.access_token
+    identity_center_changes = ChangeLog(args.change_log_versions)
+
+    # Keep the cache bounded, optionally compressed (entries are decoded only when a request needs them)
+    # and shared with the other replicas (one crawl per key across all of them)
+    shared_cache = create_shared_cache(args.shared_cache, 'identity-center', args.shared_cache_lease, args.shared_cache_wait, app.json.dumps)
+    cache = CacheStore(args.cache_compression, args.cache_hot_entries, app.json.dumps, args.cache_max_bytes, args.cache_eviction, release_cache_key, shared_cache)
 
     app.run(host='0.0.0.0', port=args.port)
 
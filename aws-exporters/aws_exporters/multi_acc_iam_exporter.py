@@ -10,9 +10,23 @@ Metadata:
 Description:
 This script retrieves and exports all account's information about AWS Identity and Access Management(IAM).
 It includes endpoints for User, Group, Role, LocalManagedPolicy and AWSManagedPolicy.
+`/multi-account-summary` returns compact per-account counters (one get_account_summary call
+per account, crawled in parallel with its own short TTL) for panels that only need counts.
+The target accounts come from a cached account directory and can be limited with
+include/exclude selectors (OU, tag, account ID list). Records are cached per filter type and
+account, so a selection only crawls its accounts whose records are missing or expired.
+Identical policy documents are stored once across accounts (content-addressed by sha256),
+and `?dedup=true` returns a deduplicated document table plus references.
+Policy statements are decoded and indexed by action, resource and effect once per refresh, and
+`/multi-account-search` answers questions such as "who allows iam:PassRole on *" from memory.
+Managed policies attached to users, groups and roles are resolved, so their statements are
+attributed to every entity they are attached to.
+Accounts are crawled in parallel under a deadline: once it passes, partial results are returned
+(with last-known-good data for missing accounts), and accounts that keep failing are backed off
+by a circuit breaker. `/crawl/status` shows the per-account status.
 
 Usage:
-    python multi_acc_iam_exporter.py --permission-set-name <permission_set_name> --sso-region <sso_region> [--port <port>] [--cache-expiry <cache_expiry>] [--cache-expiry <cache_expiry>] [--access-token <valid_sso_access_token>]
+    python multi_acc_iam_exporter.py --permission-set-name <permission_set_name> --sso-region <sso_region> [--port <port>] [--cache-expiry <cache_expiry>] [--cache-expiry <cache_expiry>] [--access-token <valid_sso_access_token>] [--org-account-id <management_account_id>]
 
 """
 
@@ -22,9 +36,17 @@ import argparse
 import os
 import time
 import logging
-from flask import Flask, jsonify
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import Flask, jsonify, request
 #from aws_utils.aws_utils import create_session, get_all_account_ids_by_sso # For Directory Structure
-from aws_exporters.aws_utils import create_session, get_all_account_ids_by_sso
+from aws_exporters.aws_utils import (
+    create_session, PolicyStore, AccountDirectory, parse_account_selectors, needs_enrichment,
+    select_accounts, PolicyIndex, CircuitBreaker, default_breaker_threshold,
+    default_breaker_backoff, default_breaker_max_backoff, default_account_directory_expiry,
+    CacheStore, cached_list_response, create_shared_cache,
+    default_shared_cache_lease, default_shared_cache_wait, COMPRESSION_CHOICES, EVICTION_CHOICES,
+    default_hot_entries, default_cache_max_bytes,
+)
 
 ### INIT CONFIGURATIONS ----------------------------------------
 # Configure logging
@@ -32,10 +54,34 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 ### GLOBAL VARIABLES -------------------------------------------
-cache = {}
+cache = CacheStore()
 cache_times = {}
 default_cache_expiry = 300  # 5 minutes
+# Values accepted by get_account_authorization_details (each one is a cache key)
+valid_filter_types = ['User', 'Role', 'Group', 'LocalManagedPolicy', 'AWSManagedPolicy']
+# Users, roles and groups only reference their managed policies, which are crawled as separate filter types
+attaching_filter_types = ['User', 'Role', 'Group']
+managed_policy_filter_types = ['LocalManagedPolicy', 'AWSManagedPolicy']
 valid_sso_access_token = None
+policy_store = PolicyStore()
+# Policy statement index per filter type over its cached records (built on the first search after a change)
+policy_indexes = {}
+policy_index_generations = {}
+# Crawl deadline, per-account status of the latest crawl and back-off for accounts that keep failing
+default_crawl_deadline = 120  # 2 minutes
+crawl_deadline = default_crawl_deadline
+default_crawl_workers = 8
+crawl_workers = default_crawl_workers
+crawl_status = {}
+account_breaker = CircuitBreaker()
+account_directory = None
+# /multi-account-summary (one get_account_summary call per account) has its own, shorter TTL
+default_summary_cache_expiry = 60  # 1 minute
+summary_cache_expiry = default_summary_cache_expiry
+default_summary_workers = 16
+summary_workers = default_summary_workers
+# Counters kept from the get_account_summary SummaryMap
+SUMMARY_COUNTERS = ['Users', 'Groups', 'Roles', 'Policies', 'AccountMFAEnabled', 'MFADevices', 'MFADevicesInUse', 'AccessKeysPerUserQuota', 'ServerCertificates']
 
 ###-------------------------------------------------------------
 
@@ -76,41 +122,340 @@ def multiAccountAuth(filter_type):
     global cache, cache_times, permission_set_name, sso_region
     current_time = time.time()
 
-    # Check if the cached data is still valid (5 minutes)
-    if filter_type in cache and (current_time - cache_times[filter_type]) < cache_expiry:
-        logger.info(f"↩️ Returning cached data for {filter_type} to reduce API calls.")
-        return jsonify(cache[filter_type])
+    # Reject unknown filter types before they create cache entries and crawls
+    if filter_type not in valid_filter_types:
+        return jsonify({"error": f"Invalid filter_type. Must be one of {valid_filter_types}"}), 400
 
-    # If not, get new data and update the cache
-    logger.info("🔍 Retrieving account IDs from AWS Identity Center...")
+    # Get the optional parameter (return a deduplicated policy document table plus references)
+    dedup = request.args.get('dedup', 'false').lower() == 'true'
 
-    # Get all account IDs from 🔴AWS Identity Center
-    account_ids = get_all_account_ids_by_sso(sso_region)
-    logger.info(f"✅ Retrieved {len(account_ids)} accounts.")
-    print(f'\n')
-    all_auth_details = []
+    # Get the optional account selectors (only the selected accounts are crawled)
+    try:
+        selectors = parse_account_selectors(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if needs_enrichment(selectors) and not account_directory.can_enrich:
+        return jsonify({"error": "OU and tag selectors require --org-account-id"}), 400
 
-    for account_id in account_ids:
+    # Get the optional parameter (crawl deadline in seconds, partial results are returned once it passes)
+    try:
+        deadline = float(request.args['deadline']) if request.args.get('deadline') else None
+    except ValueError:
+        return jsonify({"error": "Invalid deadline parameter (expected seconds)"}), 400
+    if deadline is not None and deadline <= 0:
+        return jsonify({"error": "Invalid deadline parameter (expected seconds)"}), 400
+
+    # Crawl only the selected accounts whose records are missing or expired (5 minutes)
+    account_ids = get_selected_account_ids(selectors)
+    statuses = refresh_account_records(filter_type, account_ids, current_time, cache_expiry, lambda account_id: get_auth_details_record(account_id, filter_type), crawl_workers, deadline, account_breaker)
+    keys = [record_key(filter_type, account_id) for account_id in account_ids if record_key(filter_type, account_id) in cache]
+    if account_ids and not keys:
+        return jsonify({"error": "Failed to retrieve account authorization details"}), 500
+
+    if dedup:
+        return jsonify(policy_store.dedup_view(get_account_records(filter_type, account_ids, statuses)))
+    if any(status['Status'] != 'OK' for status in statuses.values()):
+        return jsonify(get_account_records(filter_type, account_ids, statuses))
+    return cached_list_response(cache, keys)
+
+# Function to get one account's authorization details as a cache record
+def get_auth_details_record(account_id, filter_type):
+    auth_details = get_account_auth_details_for_account(account_id, permission_set_name, sso_region, filter_type)
+    if auth_details:
+        auth_details['AccountID'] = account_id
+        auth_details['CrawlStatus'] = {'Status': 'OK', 'FetchedAt': time.time()}
+    return auth_details
+
+# Function to get the cache key of one account's record (records are cached per kind and account)
+def record_key(kind, account_id):
+    return f"{kind}/{account_id}"
+
+# Function to get the selected account IDs (every account without selectors)
+def get_selected_account_ids(selectors):
+    return [account['AccountID'] for account in select_accounts(account_directory.get_accounts(enrich=needs_enrichment(selectors)), selectors)]
+
+# Function to refresh the missing or expired records of the given accounts in parallel, within the deadline
+def refresh_account_records(kind, account_ids, current_time, max_age, fetch_account, workers, deadline=None, breaker=None):
+    """
+    Crawls the accounts whose `kind` record is missing or expired and returns their statuses.
+
+    Parameters:
+    - kind (str): Filter type, or 'summary'.
+    - account_ids (list): Target accounts.
+    - current_time (float): Request time.
+    - max_age (int): Seconds a record stays fresh.
+    - fetch_account (callable): Returns the record of one account (None or an exception on failure).
+    - workers (int): Parallel crawls.
+    - deadline (float, optional): Caller-supplied deadline in seconds.
+    - breaker (CircuitBreaker, optional): Skips accounts that keep failing.
+
+    Returns:
+    - dict: {account_id: status} for the accounts that were due (empty when every record is fresh).
+    """
+    pending = [account_id for account_id in account_ids
+               if not (record_key(kind, account_id) in cache and (current_time - cache_times.get(record_key(kind, account_id), 0)) < max_age)]
+    if not pending:
+        logger.info(f"↩️ Returning cached {kind} records of {len(account_ids)} accounts to reduce API calls.")
+        return {}
+    logger.info(f"✅ Crawling {kind} for {len(pending)} of {len(account_ids)} accounts.")
+
+    # The deadline counts from the request, including any time spent waiting for another replica
+    timeout = get_crawl_timeout(deadline)
+    remaining = max(current_time + timeout - time.time(), 0)
+
+    # Crawl in parallel; accounts whose breaker is open are skipped
+    statuses = {}
+    futures = {}
+    timed_out = set()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    for account_id in pending:
+        if breaker and not breaker.allow(account_id, current_time):
+            statuses[account_id] = {'Status': 'SKIPPED', 'Error': 'Circuit breaker open after repeated failures'}
+            continue
+        logger.info("ℹ️  The target account is ... %s", account_id)
+        future = executor.submit(fetch_account_record, kind, account_id, current_time, max_age, fetch_account, remaining / 2)
+        if breaker:
+            future.add_done_callback(lambda future, account_id=account_id: record_crawl_result(account_id, future, timed_out))
+        futures[future] = account_id
+    done, not_done = wait(futures, timeout=remaining)
+    # Do not wait for stragglers (they still finish in the background and store their record for the next request)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    for future, account_id in futures.items():
+        if future in not_done:
+            logger.error(f"❌ Crawl deadline passed before account {account_id} finished.")
+            statuses[account_id] = {'Status': 'TIMEOUT', 'Error': f"Crawl deadline ({timeout}s) passed"}
+            # A slow account counts as failing, so it is backed off instead of holding every crawl to the deadline
+            # (accounts still queued behind it were never called, and a caller's shorter deadline says
+            # nothing about the account's health, so neither is counted)
+            if breaker and not future.cancelled() and timeout >= crawl_deadline:
+                timed_out.add(account_id)
+                breaker.record_failure(account_id, statuses[account_id]['Error'])
+            continue
         try:
-            logger.info("ℹ️  The target account is ... %s", account_id)
-            auth_details = get_account_auth_details_for_account(account_id, permission_set_name, sso_region, filter_type)
-            if auth_details:
-                auth_details['AccountID'] = account_id
-                all_auth_details.append(auth_details)
+            record = future.result()
         except Exception as e:
-            logger.error(f"❌ Failed to retrieve details for account {account_id}: {e}")
+            logger.error(f"❌ Failed to retrieve {kind} for account {account_id}: {e}")
+            statuses[account_id] = {'Status': 'FAILED', 'Error': str(e)}
             continue  # Skip to the next account
+        statuses[account_id] = {'Status': 'OK'} if record else {'Status': 'FAILED', 'Error': 'No data returned'}
 
-    if all_auth_details:
-        cache[filter_type] = all_auth_details
-        cache_times[filter_type] = current_time
-        return jsonify(all_auth_details)
-    else:
-        return jsonify({"error": "Failed to retrieve account authorization details"}), 500
+    previous = crawl_status.get(kind, {}).get('Accounts', {})
+    crawl_status[kind] = {
+        'Time': current_time,
+        'Duration': round(time.time() - current_time, 3),
+        'Partial': any(status['Status'] != 'OK' for status in statuses.values()),
+        'TimedOut': sum(status['Status'] == 'TIMEOUT' for status in statuses.values()),
+        'Accounts': dict(previous, **statuses),
+    }
+    return statuses
+
+# Function to fetch and cache one account's record (in a worker thread, so late records are still kept)
+def fetch_account_record(kind, account_id, current_time, max_age, fetch_account, wait_time):
+    key = record_key(kind, account_id)
+    # Crawl, or reuse the record another replica just crawled
+    record, fetched_time = cache.fetch(key, current_time, max_age, lambda: fetch_account(account_id), wait=wait_time)
+    if not record:
+        return None
+    # The record already cached here (served while another replica refreshes): keep its interned documents
+    if cache.unchanged(key):
+        cache_times[key] = fetched_time
+        return record
+
+    # Store each distinct policy document only once across accounts. Compressed entries keep
+    # no objects, so interning would only pin decoded documents outside the cache's byte budget
+    if kind in valid_filter_types and not cache.compressed:
+        policy_store.intern_auth_details(key, [record])
+    cache.set(key, record, cost=time.time() - current_time)
+    cache_times[key] = fetched_time
+    invalidate_policy_indexes(kind)
+    return record
+
+# Function to collect the cached records of the given accounts (records that failed to refresh are marked stale)
+def get_account_records(kind, account_ids, statuses):
+    records = []
+    for account_id in account_ids:
+        record = cache.get(record_key(kind, account_id))
+        if record is None:
+            continue
+        status = statuses.get(account_id)
+        if status and status['Status'] != 'OK':
+            # Last-known-good data, marked as stale (a copy, the cached record is left as crawled)
+            record = dict(record, CrawlStatus=dict(status, Stale=True, FetchedAt=(record.get('CrawlStatus') or {}).get('FetchedAt')))
+            status['Stale'] = True
+        records.append(record)
+    return records
+
+# Function to drop the statement indexes built from a kind's records (entity indexes include the managed policies)
+def invalidate_policy_indexes(kind):
+    for indexed_kind in [kind] + (attaching_filter_types if kind in managed_policy_filter_types else []):
+        policy_indexes.pop(indexed_kind, None)
+        policy_index_generations[indexed_kind] = policy_index_generations.get(indexed_kind, 0) + 1
+
+# Function to get the statement index of a filter type over its cached records, decoding statements once per change
+def get_policy_index(filter_type):
+    if filter_type in policy_indexes:
+        return policy_indexes[filter_type]
+    generation = policy_index_generations.get(filter_type, 0)
+
+    # Resolve AttachedManagedPolicies, so managed statements are attributed to every entity they are attached to
+    managed_policies = None
+    if filter_type in attaching_filter_types:
+        managed_policies = {policy['Arn']: policy for managed_filter_type in managed_policy_filter_types
+                            for auth_details in get_cached_records(managed_filter_type) for policy in auth_details.get('Policies') or [] if 'Arn' in policy}
+    index = PolicyIndex(get_cached_records(filter_type), managed_policies)
+    # Keep the index only if no record it was built from changed or was evicted meanwhile
+    if policy_index_generations.get(filter_type, 0) == generation:
+        policy_indexes[filter_type] = index
+    return index
+
+# Function to get every cached record of a kind
+def get_cached_records(kind):
+    prefix = record_key(kind, '')
+    records = (cache.get(key) for key in cache if key.startswith(prefix))
+    return [record for record in records if record is not None]
+
+# Function to get the crawl deadline (a caller-supplied deadline can shorten it, never extend it)
+def get_crawl_timeout(deadline=None):
+    return min(deadline, crawl_deadline) if deadline else crawl_deadline
+
+# Function to feed a finished (possibly late) account crawl into the circuit breaker
+def record_crawl_result(account_id, future, timed_out=()):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is None:
+        # A success after the deadline does not reset the timeout already counted as a failure
+        if account_id not in timed_out:
+            account_breaker.record_success(account_id)
+    elif account_breaker.record_failure(account_id, error) >= account_breaker.threshold > 0:
+        logger.warning(f"⚠️  Account {account_id} keeps failing, backing off: {error}")
+
+@app.route('/crawl/status', methods=['GET'])
+def crawlStatus():
+    # Per-account status of the latest crawl of each filter type (and the summary), plus the circuit breaker state
+    return jsonify({'Crawls': crawl_status, 'CircuitBreaker': account_breaker.stats()})
+
+# Function to drop everything derived from an evicted cache entry
+def release_cache_key(cache_key):
+    cache_times.pop(cache_key, None)
+    policy_store.release(cache_key)
+    invalidate_policy_indexes(cache_key.split('/', 1)[0])
+
+@app.route('/multi-account-search', methods=['GET'])
+def multiAccountSearch():
+    global cache, cache_times
+    current_time = time.time()
+
+    # Get the required parameter (comma-separated filter types to search)
+    filter_types = [value.strip() for value in request.args.get('filter_type', '').split(',') if value.strip()]
+    if not filter_types or any(filter_type not in valid_filter_types for filter_type in filter_types):
+        return jsonify({"error": f"filter_type is required. Must be any of {valid_filter_types}"}), 400
+
+    # Get the optional parameters
+    action = request.args.get('action')
+    resource = request.args.get('resource')
+    effect = request.args.get('effect')
+    if effect and effect not in ['Allow', 'Deny']:
+        return jsonify({"error": "Invalid effect. Must be 'Allow' or 'Deny'"}), 400
+
+    # Get the optional account selectors (only the selected accounts are crawled)
+    try:
+        selectors = parse_account_selectors(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if needs_enrichment(selectors) and not account_directory.can_enrich:
+        return jsonify({"error": "OU and tag selectors require --org-account-id"}), 400
+
+    # Entity filter types also need the managed policies their entities attach
+    required_filter_types = list(filter_types)
+    if any(filter_type in attaching_filter_types for filter_type in filter_types):
+        required_filter_types += [filter_type for filter_type in managed_policy_filter_types if filter_type not in filter_types]
+
+    # Crawl only the selected accounts whose records are missing or expired (5 minutes)
+    account_ids = get_selected_account_ids(selectors)
+    for filter_type in required_filter_types:
+        refresh_account_records(filter_type, account_ids, current_time, cache_expiry, lambda account_id, filter_type=filter_type: get_auth_details_record(account_id, filter_type), crawl_workers, breaker=account_breaker)
+        if account_ids and not any(record_key(filter_type, account_id) in cache for account_id in account_ids):
+            return jsonify({"error": "Failed to retrieve account authorization details"}), 500
+
+    # The indexes cover every cached account, limit the matches to the selected ones
+    selected = set(account_ids) if selectors else None
+    matches = []
+    for filter_type in filter_types:
+        matches.extend(get_policy_index(filter_type).search(action=action, resource=resource, effect=effect, account_ids=selected))
+
+    return jsonify({'Query': {'filter_type': filter_types, 'action': action, 'resource': resource, 'effect': effect}, 'Count': len(matches), 'Statements': matches})
+
+# Function to get the IAM counters for an account
+def get_account_summary_for_account(account_id, permission_set_name, sso_region):
+    # Create a Boto3 client for the IAM
+    client = create_session(account_id, permission_set_name, sso_region, "iam", valid_sso_access_token)
+    if not client:
+        return None
+
+    summary_map = client.get_account_summary()['SummaryMap']
+    summary = {counter: summary_map.get(counter, 0) for counter in SUMMARY_COUNTERS}
+    # The summary counts MFA devices, not users: a user with two devices hides another user
+    # without one, so this is only a lower-bound estimate (the credential report has the exact list)
+    users_with_mfa = summary['MFADevicesInUse'] - summary['AccountMFAEnabled']
+    summary['UsersWithoutMFAEstimate'] = max(summary['Users'] - users_with_mfa, 0)
+    summary['MFAGap'] = summary['AccountMFAEnabled'] == 0 or summary['UsersWithoutMFAEstimate'] > 0
+    return summary
+
+# Function to get one account's summary as a cache record
+def get_summary_record(account_id, account_names):
+    summary = get_account_summary_for_account(account_id, permission_set_name, sso_region)
+    if summary is None:
+        return None
+    return dict(summary, AccountID=account_id, AccountName=account_names.get(account_id))
+
+@app.route('/multi-account-summary', methods=['GET'])
+def multiAccountSummary():
+    global cache, cache_times, permission_set_name, sso_region
+    current_time = time.time()
+
+    # Get the optional account selectors (only the selected accounts are summarized)
+    try:
+        selectors = parse_account_selectors(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if needs_enrichment(selectors) and not account_directory.can_enrich:
+        return jsonify({"error": "OU and tag selectors require --org-account-id"}), 400
+
+    # Summarize only the selected accounts whose record is missing or expired (1 minute), in parallel
+    accounts = select_accounts(account_directory.get_accounts(enrich=needs_enrichment(selectors)), selectors)
+    account_ids = [account['AccountID'] for account in accounts]
+    account_names = {account['AccountID']: account.get('AccountName') for account in accounts}
+    statuses = refresh_account_records('summary', account_ids, current_time, summary_cache_expiry, lambda account_id: get_summary_record(account_id, account_names), summary_workers)
+    keys = [record_key('summary', account_id) for account_id in account_ids if record_key('summary', account_id) in cache]
+    if account_ids and not keys:
+        return jsonify({"error": "Failed to retrieve account summaries"}), 500
+
+    if any(status['Status'] != 'OK' for status in statuses.values()):
+        return jsonify(get_account_records('summary', account_ids, statuses))
+    return cached_list_response(cache, keys)
+
+@app.route('/accounts', methods=['GET'])
+def accounts():
+    # Get the optional account selectors
+    try:
+        selectors = parse_account_selectors(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    enrich = request.args.get('enrich', 'false').lower() == 'true' or needs_enrichment(selectors)
+    if enrich and not account_directory.can_enrich:
+        return jsonify({"error": "OU paths, tags and OU/tag selectors require --org-account-id"}), 400
+
+    return jsonify({'Accounts': select_accounts(account_directory.get_accounts(enrich=enrich), selectors)})
+
+@app.route('/cache/usage', methods=['GET'])
+def cache_usage():
+    return jsonify(cache.stats())
 
 def main():
     global valid_sso_access_token
-    global permission_set_name, sso_region, cache_expiry, valid_sso_access_token
+    global permission_set_name, sso_region, cache_expiry, valid_sso_access_token, cache, account_directory, summary_cache_expiry, summary_workers, crawl_deadline, crawl_workers, account_breaker
 
     parser = argparse.ArgumentParser(description="Getting account's details within across multiple AWS accounts.")
     parser.add_argument('--permission-set-name', type=str, required=True, help="Name of the permission set to assume in each target account.")
@@ -118,12 +463,44 @@ def main():
     parser.add_argument('--port', type=int, default=1989, help="Port to run the Flask app on.")
     parser.add_argument('--cache-expiry', type=int, default=default_cache_expiry, help="Cache expiry time in seconds.")
     parser.add_argument('--access-token', type=str, default=valid_sso_access_token, help="Valid access token.")
+    parser.add_argument('--crawl-deadline', type=float, default=default_crawl_deadline, help="Seconds a crawl may take before partial results are returned.")
+    parser.add_argument('--crawl-workers', type=int, default=default_crawl_workers, help="Number of accounts crawled in parallel.")
+    parser.add_argument('--breaker-threshold', type=int, default=default_breaker_threshold, help="Consecutive failures before an account is skipped (0 = never).")
+    parser.add_argument('--breaker-backoff', type=int, default=default_breaker_backoff, help="Seconds a failing account is skipped (doubles with every further failure).")
+    parser.add_argument('--breaker-max-backoff', type=int, default=default_breaker_max_backoff, help="Upper bound of the back-off in seconds.")
+    parser.add_argument('--summary-cache-expiry', type=int, default=default_summary_cache_expiry, help="Cache expiry time of /multi-account-summary in seconds.")
+    parser.add_argument('--summary-workers', type=int, default=default_summary_workers, help="Number of accounts summarized in parallel.")
+    parser.add_argument('--account-directory-expiry', type=int, default=default_account_directory_expiry, help="Cache expiry time of the account list in seconds.")
+    parser.add_argument('--org-account-id', type=str, default=None, help="Management (or delegated admin) account ID to read OU paths and tags from AWS Organizations.")
+    parser.add_argument('--cache-compression', type=str, choices=COMPRESSION_CHOICES, default='none', help="Keep cache entries as compressed JSON ('zstd' needs the zstandard module).")
+    parser.add_argument('--cache-hot-entries', type=int, default=default_hot_entries, help="Number of decoded cache entries kept in memory when compression is enabled.")
+    parser.add_argument('--cache-max-bytes', type=int, default=default_cache_max_bytes, help="Memory budget for the cache in bytes (0 = unbounded).")
+    parser.add_argument('--cache-eviction', type=str, choices=EVICTION_CHOICES, default='lru', help="Eviction policy used when the cache exceeds its memory budget.")
+    parser.add_argument('--shared-cache', type=str, default=None, help="Cache shared by all replicas: redis://host:port/db or a shared directory (only the lease holder crawls AWS).")
+    parser.add_argument('--shared-cache-lease', type=int, default=default_shared_cache_lease, help="Seconds a replica holds the lease of a key while it refreshes it.")
+    parser.add_argument('--shared-cache-wait', type=int, default=default_shared_cache_wait, help="Seconds a replica waits for the lease holder's first result before crawling itself.")
     args = parser.parse_args()
 
     permission_set_name = args.permission_set_name
     sso_region = args.sso_region
     cache_expiry = args.cache_expiry
     valid_sso_access_token = args.access_token
+    summary_cache_expiry = args.summary_cache_expiry
+    crawl_deadline = args.crawl_deadline
+    crawl_workers = args.crawl_workers
+    account_breaker = CircuitBreaker(args.breaker_threshold, args.breaker_backoff, args.breaker_max_backoff)
+    summary_workers = args.summary_workers
+
+    # Build the account directory (OU paths and tags come from AWS Organizations when an account is given)
+    org_client_factory = None
+    if args.org_account_id:
+        org_client_factory = lambda: create_session(args.org_account_id, permission_set_name, sso_region, "organizations", valid_sso_access_token)
+    account_directory = AccountDirectory(sso_region, args.account_directory_expiry, valid_sso_access_token, org_client_factory)
+
+    # Keep the cache bounded, optionally compressed (entries are decoded only when a request needs them)
+    # and shared with the other replicas (one crawl per key across all of them)
+    shared_cache = create_shared_cache(args.shared_cache, 'multi-acc-iam', args.shared_cache_lease, args.shared_cache_wait, app.json.dumps)
+    cache = CacheStore(args.cache_compression, args.cache_hot_entries, app.json.dumps, args.cache_max_bytes, args.cache_eviction, release_cache_key, shared_cache)
 
     app.run(host='0.0.0.0', port=args.port)
 
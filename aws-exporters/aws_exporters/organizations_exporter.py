@@ -10,6 +10,10 @@ Metadata:
 Description:
 This script retrieves and exports information about AWS Organizations and Identity Center.
 It includes endpoints for organization structure, policies, and access reports.
+Each refresh is diffed against the previous crawl, and `/organization/changes?since=<epoch>.<version>`
+returns only the added, removed and modified nodes.
+Flat lookup indexes (account -> OU path, OU -> descendant accounts, policy -> effective targets)
+are built once per refresh and served by `/organization/lookup/...`.
 
 Usage:
     python organizations_exporter.py --mgmt-account-id <management_account_id> --permission-set-name <permission_set_name> --sso-region <sso_region> [--port <port>] [--cache-expiry <cache_expiry>] [--cache-expiry <cache_expiry>] [--access-token <valid_sso_access_token>]
@@ -24,7 +28,11 @@ import time
 import logging
 from flask import Flask, jsonify, request
 #from aws_utils.aws_utils import create_session # For Directory Structure
-from aws_exporters.aws_utils import create_session
+from aws_exporters.aws_utils import (
+    create_session, ChangeLog, default_change_log_versions, CacheStore, cached_response,
+    create_shared_cache, default_shared_cache_lease, default_shared_cache_wait, COMPRESSION_CHOICES,
+    EVICTION_CHOICES, default_hot_entries, default_cache_max_bytes,
+)
 from datetime import datetime
 
 ### INIT CONFIGURATIONS ----------------------------------------
@@ -33,10 +41,13 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 ### GLOBAL VARIABLES -------------------------------------------
-cache = {}
+cache = CacheStore()
 cache_times = {}
 default_cache_expiry = 3600  # 60 minutes
 valid_sso_access_token = None
+org_changes = ChangeLog()
+# Lookup indexes (account -> OU path, OU -> descendant accounts, policy -> effective targets)
+org_indexes = {}
 
 ###-------------------------------------------------------------
 
@@ -81,7 +92,9 @@ def get_policies(org_client, policy_type):
     for response in response_iterator:
         for policy in response['Policies']:
             policy_details = org_client.describe_policy(PolicyId=policy['Id'])['Policy']
-            policy_targets = org_client.list_targets_for_policy(PolicyId=policy['Id'])['Targets']
+            policy_targets = []
+            for targets_response in org_client.get_paginator('list_targets_for_policy').paginate(PolicyId=policy['Id']):
+                policy_targets.extend(targets_response['Targets'])
             policy_details['Targets'] = policy_targets
             policies.append(policy_details)
     
@@ -114,6 +127,17 @@ def generate_organizations_access_report(iam_client, org_client):
         logger.error(f"❌ Failed to generate access report: {e}")
         return None
 
+# Function to generate the access report from the management account
+def get_access_report(mgmt_account_id, permission_set_name, sso_region):
+    # Create a Boto3 client for the Organizations and IAM service
+    org_client = create_session(mgmt_account_id, permission_set_name, sso_region, "organizations", valid_sso_access_token)
+    iam_client = create_session(mgmt_account_id, permission_set_name, sso_region, "iam", valid_sso_access_token)
+
+    if not org_client:
+        return None
+
+    return generate_organizations_access_report(iam_client, org_client)
+
 # Main function to get organization information
 def get_org_structure(mgmt_account_id, permission_set_name, sso_region):
     # Create a Boto3 client for the Organizations service
@@ -135,6 +159,51 @@ def get_org_structure(mgmt_account_id, permission_set_name, sso_region):
     
     return {'organizations': org_structure}
 
+# Function to flatten the organization tree into {node_id: node} for diffing
+def flatten_org_structure(org_structure):
+    nodes = {}
+
+    def add_parent(parent, node_type, parent_id):
+        node_id = f"{node_type}:{parent['Id']}"
+        node = {key: value for key, value in parent.items() if key not in ('OrganizationalUnits', 'Accounts')}
+        nodes[node_id] = dict(node, NodeId=node_id, ParentId=parent_id)
+        for ou in parent.get('OrganizationalUnits', []):
+            if 'Id' in ou:
+                add_parent(ou, 'ou', parent['Id'])
+        for account in parent.get('Accounts', []):
+            if 'Id' in account:
+                account_node_id = f"account:{account['Id']}"
+                nodes[account_node_id] = dict(account, NodeId=account_node_id, ParentId=parent['Id'])
+
+    for root in org_structure['organizations']:
+        add_parent(root, 'root', None)
+    return nodes
+
+# Function to refresh the organization structure and everything derived from it
+def refresh_org_structure(current_time):
+    # Crawl, or reuse the structure another replica just crawled
+    organization_structure, fetched_time = cache.fetch('organization', current_time, cache_expiry, lambda: get_org_structure(mgmt_account_id, permission_set_name, sso_region))
+    if not organization_structure:
+        return None
+    # The snapshot already cached here (served while another replica refreshes): keep the indexes and the change log
+    if cache.unchanged('organization'):
+        cache_times['organization'] = org_indexes['tree_time'] = fetched_time
+        return organization_structure
+
+    cache.set('organization', organization_structure, cost=time.time() - current_time)
+    cache_times['organization'] = fetched_time
+    # Flat lookup indexes, built once per refresh
+    org_indexes['accounts'], org_indexes['ous'] = build_tree_indexes(organization_structure)
+    org_indexes['tree_time'] = fetched_time
+    if 'policy_sources' in org_indexes:
+        org_indexes['policies'] = build_policy_index(org_indexes['policy_sources'], org_indexes['ous'])
+    # Diff against the previous crawl once, here, instead of in every consumer. Nodes go through the
+    # response serializer first: a fresh crawl holds datetimes, while compressed or shared hits hold
+    # their JSON strings, and the two would otherwise compare as modified
+    version = org_changes.record(json.loads(app.json.dumps(flatten_org_structure(organization_structure))))
+    logger.info(f"🔔 Organization structure is at version {version}.")
+    return organization_structure
+
 @app.route('/organization', methods=['GET'])
 def organization():
     global cache, cache_times, mgmt_account_id, permission_set_name, sso_region, cache_expiry
@@ -143,28 +212,35 @@ def organization():
     # Check if the cached data is still valid (60 minutes)
     if 'organization' in cache and (current_time - cache_times['organization']) < cache_expiry:
         logger.info("↩️  Returning cached data to reduce API calls.")
-        return jsonify(cache['organization'])
+        return cached_response(cache, 'organization')
 
     # If not, get new data and update the cache
-    organization_structure = get_org_structure(mgmt_account_id, permission_set_name, sso_region)
+    organization_structure = refresh_org_structure(current_time)
     if organization_structure:
-        cache['organization'] = organization_structure
-        cache_times['organization'] = current_time
         return jsonify(organization_structure)
     else:
         return jsonify({"error": "Failed to retrieve organization structure"}), 500
 
-@app.route('/organization/policies', methods=['GET'])
-def organization_policies():
-    global cache, cache_times, mgmt_account_id, permission_set_name, sso_region, cache_expiry
+@app.route('/organization/changes', methods=['GET'])
+def organization_changes():
     current_time = time.time()
 
-    # Check if the cached data is still valid (60 minutes)
-    if 'policies' in cache and (current_time - cache_times['policies']) < cache_expiry:
-        logger.info("↩️  Returning cached data to reduce API calls.")
-        return jsonify(cache['policies'])
+    # Get the optional parameter (the Version token of a previous response, `<epoch>.<version>`)
+    since = request.args.get('since') or None
+    try:
+        ChangeLog.parse_token(since)
+    except ValueError:
+        return jsonify({"error": "Invalid since parameter (expected the Version token of a previous response)"}), 400
 
-    # If not, get new data and update the cache
+    # Refresh (and diff) when the cached snapshot has expired (60 minutes)
+    if not ('organization' in cache and (current_time - cache_times['organization']) < cache_expiry):
+        if not refresh_org_structure(current_time):
+            return jsonify({"error": "Failed to retrieve organization structure"}), 500
+
+    return jsonify(org_changes.changes_since(since))
+
+# Function to get the SCPs and tag policies
+def get_org_policies(mgmt_account_id, permission_set_name, sso_region):
     # Create a Boto3 client for the Organizations service
     org_client = create_session(mgmt_account_id, permission_set_name, sso_region, "organizations", valid_sso_access_token)
 
@@ -173,17 +249,135 @@ def organization_policies():
 
     scp_policies = get_policies(org_client, 'SERVICE_CONTROL_POLICY')
     tag_policies = get_policies(org_client, 'TAG_POLICY')
-    policies = {
+    return {
         'ServiceControlPolicies': scp_policies,
         'TagPolicies': tag_policies
     }
+
+# Function to refresh the organization policies and the policy index
+def refresh_org_policies(current_time):
+    # Crawl, or reuse the policies another replica just crawled
+    policies, fetched_time = cache.fetch('policies', current_time, cache_expiry, lambda: get_org_policies(mgmt_account_id, permission_set_name, sso_region))
+    if not policies:
+        return None
+
+    cache.set('policies', policies, cost=time.time() - current_time)
+    cache_times['policies'] = fetched_time
+    org_indexes['policy_sources'] = policies
+    org_indexes['policies_time'] = fetched_time
+    if 'ous' in org_indexes:
+        org_indexes['policies'] = build_policy_index(policies, org_indexes['ous'])
+    return policies
+
+@app.route('/organization/policies', methods=['GET'])
+def organization_policies():
+    global cache, cache_times, mgmt_account_id, permission_set_name, sso_region, cache_expiry
+    current_time = time.time()
+
+    # Check if the cached data is still valid (60 minutes)
+    if 'policies' in cache and (current_time - cache_times['policies']) < cache_expiry:
+        logger.info("↩️  Returning cached data to reduce API calls.")
+        return cached_response(cache, 'policies')
+
+    # If not, get new data and update the cache
+    policies = refresh_org_policies(current_time)
     if policies:
-        cache['policies'] = policies
-        cache_times['policies'] = current_time
         return jsonify(policies)
     else:
         return jsonify({"error": "Failed to retrieve organization structure"}), 500
 
+# Function to build the account/OU lookup indexes from the organization tree
+def build_tree_indexes(org_structure):
+    accounts = {}
+    ous = {}
+
+    def walk(parent, path):
+        path = path + [{'Id': parent['Id'], 'Name': parent.get('Name')}]
+        path_name = '/'.join(node['Name'] or node['Id'] for node in path)
+        descendant_accounts = []
+        descendant_ous = []
+        for ou in parent.get('OrganizationalUnits', []):
+            if 'Id' in ou:
+                child_accounts, child_ous = walk(ou, path)
+                descendant_accounts.extend(child_accounts)
+                descendant_ous.extend([ou['Id']] + child_ous)
+        for account in parent.get('Accounts', []):
+            if 'Id' in account:
+                accounts[account['Id']] = {'Account': account, 'OUPath': path, 'Path': path_name}
+                descendant_accounts.append(account['Id'])
+        ous[parent['Id']] = {
+            'Id': parent['Id'],
+            'Name': parent.get('Name'),
+            'Path': path_name,
+            'DescendantAccounts': descendant_accounts,
+            'DescendantOUs': descendant_ous,
+        }
+        return descendant_accounts, descendant_ous
+
+    for root in org_structure['organizations']:
+        walk(root, [])
+    return accounts, ous
+
+# Function to build the policy -> effective targets index (attachments to a root/OU apply to everything below it)
+def build_policy_index(policies, ous):
+    policy_index = {}
+    for policy_list in policies.values():
+        for policy in policy_list:
+            summary = policy.get('PolicySummary', {})
+            effective_accounts = set()
+            effective_ous = set()
+            for target in policy.get('Targets', []):
+                if target.get('Type') == 'ACCOUNT':
+                    effective_accounts.add(target['TargetId'])
+                elif target['TargetId'] in ous:
+                    effective_accounts.update(ous[target['TargetId']]['DescendantAccounts'])
+                    effective_ous.update(ous[target['TargetId']]['DescendantOUs'])
+                    if target.get('Type') == 'ORGANIZATIONAL_UNIT':
+                        effective_ous.add(target['TargetId'])
+            policy_index[summary.get('Id')] = {
+                'PolicyId': summary.get('Id'),
+                'Name': summary.get('Name'),
+                'Type': summary.get('Type'),
+                'DirectTargets': policy.get('Targets', []),
+                'EffectiveAccounts': sorted(effective_accounts),
+                'EffectiveOUs': sorted(effective_ous),
+            }
+    return policy_index
+
+# Function to make sure the lookup indexes are built from unexpired crawls
+def ensure_org_indexes(current_time, with_policies=False):
+    if 'accounts' not in org_indexes or (current_time - org_indexes['tree_time']) >= cache_expiry:
+        if not refresh_org_structure(current_time):
+            return False
+    if with_policies and ('policies' not in org_indexes or (current_time - org_indexes['policies_time']) >= cache_expiry):
+        if not refresh_org_policies(current_time):
+            return False
+    return True
+
+@app.route('/organization/lookup/account/<account_id>', methods=['GET'])
+def lookup_account(account_id):
+    if not ensure_org_indexes(time.time()):
+        return jsonify({"error": "Failed to retrieve organization structure"}), 500
+    if account_id not in org_indexes['accounts']:
+        return jsonify({"error": f"Account {account_id} not found"}), 404
+    return jsonify(org_indexes['accounts'][account_id])
+
+@app.route('/organization/lookup/ou/<ou_id>/accounts', methods=['GET'])
+def lookup_ou_accounts(ou_id):
+    if not ensure_org_indexes(time.time()):
+        return jsonify({"error": "Failed to retrieve organization structure"}), 500
+    if ou_id not in org_indexes['ous']:
+        return jsonify({"error": f"OU {ou_id} not found"}), 404
+    return jsonify(org_indexes['ous'][ou_id])
+
+@app.route('/organization/lookup/policy/<policy_id>/targets', methods=['GET'])
+def lookup_policy_targets(policy_id):
+    if not ensure_org_indexes(time.time(), with_policies=True):
+        return jsonify({"error": "Failed to retrieve organization structure or policies"}), 500
+    if policy_id not in org_indexes['policies']:
+        return jsonify({"error": f"Policy {policy_id} not found"}), 404
+    return jsonify(org_indexes['policies'][policy_id])
+
 @app.route('/organization/access-report', methods=['GET'])
 def access_report():
     global cache, cache_times, mgmt_account_id, permission_set_name, sso_region, cache_expiry
@@ -192,26 +386,27 @@ def access_report():
     # Check if the cached data is still valid (60 minutes)
     if 'access_report' in cache and (current_time - cache_times['access_report']) < cache_expiry:
         logger.info("↩️  Returning cached data to reduce API calls.")
-        return jsonify(cache['access_report'])
-
-    # If not, get new data and update the cache
-    # Create a Boto3 client for the Organizations and IAM service
-    org_client = create_session(mgmt_account_id, permission_set_name, sso_region, "organizations", valid_sso_access_token)
-    iam_client = create_session(mgmt_account_id, permission_set_name, sso_region, "iam", valid_sso_access_token)
+        return cached_response(cache, 'access_report')
 
-    if not org_client:
-        return None
-
-    access_report = generate_organizations_access_report(iam_client, org_client)
+    # If not, get new data (or the report another replica just generated) and update the cache
+    access_report, fetched_time = cache.fetch('access_report', current_time, cache_expiry, lambda: get_access_report(mgmt_account_id, permission_set_name, sso_region))
     if access_report:
-        cache['access_report'] = access_report
-        cache_times['access_report'] = current_time
+        cache.set('access_report', access_report, cost=time.time() - current_time)
+        cache_times['access_report'] = fetched_time
         return jsonify(access_report)
     else:
         return jsonify({"error": "Failed to retrieve access report"}), 500
 
+# Function to drop the bookkeeping of an evicted cache entry
+def release_cache_key(cache_key):
+    cache_times.pop(cache_key, None)
+
+@app.route('/cache/usage', methods=['GET'])
+def cache_usage():
+    return jsonify(cache.stats())
+
 def main():
-    global mgmt_account_id, permission_set_name, sso_region, cache_expiry, valid_sso_access_token
+    global mgmt_account_id, permission_set_name, sso_region, cache_expiry, valid_sso_access_token, cache, org_changes
 
     parser = argparse.ArgumentParser(description="Retrieve AWS Organizations structure, policies and Organizations Access Report.")
     parser.add_argument('--mgmt-account-id', type=str, required=True, help="Management account ID.")
@@ -220,6 +415,14 @@ def main():
     parser.add_argument('--port', type=int, default=7723, help="Port to run the Flask app on.")
     parser.add_argument('--cache-expiry', type=int, default=default_cache_expiry, help="Cache expiry time in seconds.")
     parser.add_argument('--access-token', type=str, default=valid_sso_access_token, help="Valid access token.")
+    parser.add_argument('--change-log-versions', type=int, default=default_change_log_versions, help="Number of snapshot diffs kept for /organization/changes.")
+    parser.add_argument('--cache-compression', type=str, choices=COMPRESSION_CHOICES, default='none', help="Keep cache entries as compressed JSON ('zstd' needs the zstandard module).")
+    parser.add_argument('--cache-hot-entries', type=int, default=default_hot_entries, help="Number of decoded cache entries kept in memory when compression is enabled.")
+    parser.add_argument('--cache-max-bytes', type=int, default=default_cache_max_bytes, help="Memory budget for the cache in bytes (0 = unbounded).")
+    parser.add_argument('--cache-eviction', type=str, choices=EVICTION_CHOICES, default='lru', help="Eviction policy used when the cache exceeds its memory budget.")
+    parser.add_argument('--shared-cache', type=str, default=None, help="Cache shared by all replicas: redis://host:port/db or a shared directory (only the lease holder crawls AWS).")
+    parser.add_argument('--shared-cache-lease', type=int, default=default_shared_cache_lease, help="Seconds a replica holds the lease of a key while it refreshes it.")
+    parser.add_argument('--shared-cache-wait', type=int, default=default_shared_cache_wait, help="Seconds a replica waits for the lease holder's first result before crawling itself.")
     args = parser.parse_args()
 
     mgmt_account_id = args.mgmt_account_id
@@ -227,6 +430,12 @@ def main():
     sso_region = args.sso_region
     cache_expiry = args.cache_expiry
     valid_sso_access_token = args.access_token
+    org_changes = ChangeLog(args.change_log_versions)
+
+    # Keep the cache bounded, optionally compressed (entries are decoded only when a request needs them)
+    # and shared with the other replicas (one crawl per key across all of them)
+    shared_cache = create_shared_cache(args.shared_cache, 'organizations', args.shared_cache_lease, args.shared_cache_wait, app.json.dumps)
+    cache = CacheStore(args.cache_compression, args.cache_hot_entries, app.json.dumps, args.cache_max_bytes, args.cache_eviction, release_cache_key, shared_cache)
 
     app.run(host='0.0.0.0', port=args.port)
 
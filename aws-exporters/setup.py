@@ -12,6 +12,9 @@ setup(
         'Flask',
         'pytz',
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     url='https://github.com/Hideki-Morita/aws-native-observability-exporters',
     classifiers=[
         'Programming Language :: Python :: 3',
@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('flask')
+
+from aws_exporters.aws_utils import CacheStore, estimate_size
+
+VALUE = {'Items': ['x' * 100]}
+
+
+def budget(entries):
+    return estimate_size(VALUE) * entries
+
+
+def test_lru_eviction_drops_the_least_recently_used_entry():
+    evicted = []
+    cache = CacheStore(max_bytes=budget(2), on_evict=evicted.append)
+    cache.set('a', VALUE)
+    cache.set('b', VALUE)
+    cache['a']                 # touch a, so b is the least recently used
+    cache.set('c', VALUE)
+
+    assert sorted(cache) == ['a', 'c']
+    assert evicted == ['b']
+    assert cache.stats()['Evictions'] == 1
+
+
+def test_cost_eviction_keeps_expensive_entries():
+    evicted = []
+    cache = CacheStore(max_bytes=budget(2), eviction='cost', on_evict=evicted.append)
+    cache.set('expensive', VALUE, cost=30.0)
+    cache.set('cheap', VALUE, cost=0.1)
+    cache.set('new', VALUE, cost=1.0)
+
+    assert sorted(cache) == ['expensive', 'new']
+    assert evicted == ['cheap']
+
+
+def test_entry_over_budget_on_its_own_is_not_kept():
+    evicted = []
+    cache = CacheStore(max_bytes=budget(1) // 2, on_evict=evicted.append)
+    cache.set('huge', VALUE)
+
+    assert 'huge' not in cache
+    assert evicted == ['huge']
+
+
+def test_compressed_entries_round_trip_as_json():
+    cache = CacheStore(compression='zlib', hot_entries=0)
+    cache.set('key', VALUE)
+
+    assert cache['key'] == VALUE
+    assert cache.get_json('key') == cache.dumps(VALUE).encode('utf-8')
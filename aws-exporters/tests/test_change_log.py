@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('flask')
+
+from aws_exporters.aws_utils import ChangeLog
+
+
+def test_first_request_resyncs_with_every_node():
+    change_log = ChangeLog()
+    change_log.record({'a': {'Id': 'a'}})
+
+    response = change_log.changes_since()
+    assert response['Resync'] is True
+    assert response['Added'] == [{'Id': 'a'}]
+    assert response['Version'] == f"{change_log.epoch}.1"
+
+
+def test_identical_snapshot_keeps_the_version():
+    change_log = ChangeLog()
+    assert change_log.record({'a': 1}) == 1
+    assert change_log.record({'a': 1}) == 1
+
+
+def test_deltas_are_folded_into_net_changes():
+    change_log = ChangeLog()
+    change_log.record({'a': 1, 'b': 1, 'c': 1})
+    token = change_log.changes_since()['Version']
+    change_log.record({'a': 2, 'c': 1, 'd': 1})      # a modified, b removed, d added
+    change_log.record({'a': 2, 'b': 1, 'd': 2})      # b re-added, c removed, d modified
+
+    response = change_log.changes_since(token)
+    assert response['Resync'] is False
+    assert sorted(response['Added']) == [2]           # d: added then modified is still added
+    assert sorted(response['Modified']) == [1, 2]     # b: removed then re-added; a: modified
+    assert response['Removed'] == ['c']
+
+
+def test_other_epoch_or_expired_version_resyncs():
+    change_log = ChangeLog(max_versions=2)
+    for value in range(4):
+        change_log.record({'a': value})
+
+    assert change_log.changes_since(f"{change_log.epoch + 1}.4")['Resync'] is True
+    assert change_log.changes_since(f"{change_log.epoch}.1")['Resync'] is True
+    assert change_log.changes_since(f"{change_log.epoch}.5")['Resync'] is True
+    assert change_log.changes_since(f"{change_log.epoch}.2")['Resync'] is False
+
+
+def test_bare_version_is_rejected():
+    change_log = ChangeLog()
+    with pytest.raises(ValueError):
+        change_log.changes_since('1')
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('flask')
+
+from aws_exporters.aws_utils import PolicyIndex
+
+
+def role(account_id, name, statements, attached=()):
+    return {
+        'AccountID': account_id,
+        'RoleDetailList': [{
+            'RoleName': name,
+            'Arn': f"arn:aws:iam::{account_id}:role/{name}",
+            'RolePolicyList': [{'PolicyName': f"{name}-inline", 'PolicyDocument': {'Statement': statements}}],
+            'AttachedManagedPolicies': [{'PolicyName': arn.rsplit('/', 1)[1], 'PolicyArn': arn} for arn in attached],
+        }],
+    }
+
+
+@pytest.fixture
+def index():
+    return PolicyIndex([
+        role('111111111111', 'exact', [{'Effect': 'Allow', 'Action': 'iam:PassRole', 'Resource': '*'}]),
+        role('111111111111', 'service-wildcard', [{'Effect': 'Allow', 'Action': 's3:Get*', 'Resource': 'arn:aws:s3:::bucket/*'}]),
+        role('222222222222', 'not-action', [{'Effect': 'Allow', 'NotAction': 'iam:*', 'Resource': '*'}]),
+        role('222222222222', 'deny', [{'Effect': 'Deny', 'Action': '*', 'Resource': '*'}]),
+    ])
+
+
+def names(statements):
+    return sorted(statement['EntityName'] for statement in statements)
+
+
+def test_search_exact_action_is_case_insensitive(index):
+    assert names(index.search(action='IAM:PassRole', effect='Allow')) == ['exact']
+
+
+def test_search_matches_wildcard_statements(index):
+    assert names(index.search(action='s3:GetObject', effect='Allow')) == ['not-action', 'service-wildcard']
+    assert names(index.search(action='s3:GetObject', effect='Deny')) == ['deny']
+
+
+def test_search_with_wildcard_query(index):
+    assert names(index.search(action='iam:*', effect='Allow')) == ['exact']
+
+
+def test_search_filters_resource_and_accounts(index):
+    assert names(index.search(action='s3:GetObject', resource='arn:aws:s3:::other/key', effect='Allow')) == ['not-action']
+    assert names(index.search(action='s3:GetObject', account_ids={'111111111111'})) == ['service-wildcard']
+    assert index.search(action='s3:GetObject', account_ids=set()) == []
+
+
+def test_search_resolves_attached_managed_policies():
+    arn = 'arn:aws:iam::aws:policy/ReadOnly'
+    managed = {arn: {'Arn': arn, 'PolicyVersionList': [
+        {'IsDefaultVersion': False, 'Document': {'Statement': [{'Effect': 'Allow', 'Action': 'ec2:*', 'Resource': '*'}]}},
+        {'IsDefaultVersion': True, 'Document': {'Statement': [{'Effect': 'Allow', 'Action': 'sqs:ReceiveMessage', 'Resource': '*'}]}},
+    ]}}
+    index = PolicyIndex([role('111111111111', 'reader', [], attached=[arn])], managed)
+
+    matches = index.search(action='sqs:ReceiveMessage')
+    assert [(match['EntityName'], match['PolicySource'], match['PolicyArn']) for match in matches] == [('reader', 'Managed', arn)]
+    assert index.search(action='ec2:RunInstances') == []
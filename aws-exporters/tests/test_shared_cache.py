@@ -0,0 +1,62 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('flask')
+
+from aws_exporters.aws_utils.shared_cache import DirectoryBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return DirectoryBackend(str(tmp_path), 'test')
+
+
+def test_lease_is_exclusive_until_released(backend):
+    assert backend.acquire_lease('key', 'first', 60)
+    assert not backend.acquire_lease('key', 'second', 60)
+
+    backend.release_lease('key', 'second')  # not the holder, keeps the lease
+    assert not backend.acquire_lease('key', 'second', 60)
+
+    backend.release_lease('key', 'first')
+    assert backend.acquire_lease('key', 'second', 60)
+
+
+def test_expired_lease_is_taken_over(backend):
+    assert backend.acquire_lease('key', 'dead', 0.01)
+    time.sleep(0.05)
+    assert backend.acquire_lease('key', 'alive', 60)
+    assert not backend.acquire_lease('key', 'other', 60)
+
+
+def test_unreadable_lease_expires_after_ttl(backend):
+    # A lease without an expiry (e.g. left empty by a crash) expires ttl seconds after it was written
+    lease = backend._file('key', '.lease')
+    with open(lease, 'w'):
+        pass
+    assert not backend.acquire_lease('key', 'owner', 60)
+
+    old = time.time() - 120
+    os.utime(lease, (old, old))
+    assert backend.acquire_lease('key', 'owner', 60)
+
+
+def test_entries_round_trip(backend):
+    assert backend.get('key') is None
+    backend.set('key', b'payload', 60)
+    assert backend.get('key') == b'payload'
+    assert not [name for name in os.listdir(backend.path) if name.endswith('.tmp')]
+
+
+def test_expired_entries_are_ignored_and_swept(backend, monkeypatch):
+    backend.set('old', b'payload', 0.01)
+    time.sleep(0.05)
+    assert backend.get('old') is None
+
+    monkeypatch.setattr(backend, 'last_sweep', 0)
+    backend.set('new', b'payload', 60)
+    assert backend.get('new') == b'payload'
+    assert sorted(os.listdir(backend.path)) == [os.path.basename(backend._file('new', '.entry'))]